@@ -34,12 +34,12 @@ class Indentation:
     loadFischerScope, nextFischerScopeTest, loadHDF5, nextHDF5Test, restartFile
   from .main import calcYoungsModulus, calcHardness, calcStiffness2Force, analyse, \
     identifyLoadHoldUnload, identifyLoadHoldUnloadCSM, nextTest, saveToUserMeta, correctThermalDrift
-  from .theory import YoungsModulus, ReducedModulus, OliverPharrMethod, inverseOliverPharrMethod,\
-    stiffnessFromUnloading, unloadingPowerFunc
+  from .theory import YoungsModulus, ReducedModulus, OliverPharrMethod, OliverPharrMethodScalar, \
+    inverseOliverPharrMethod, stiffnessFromUnloading, unloadingPowerFunc, unloadingPowerJac
   from .hertz import popIn, hertzFit
   from .plot import plotTestingMethod, plot, plotAsDepth, plotAll
   from .calibration import calibration, calibrateStiffness
-  from .verification import verifyOneData, verifyOneData1, verifyReadCalc
+  from .verification import verifyOneData, verifyOneData1, verifyReadCalc, verifyReadCalcAll
   from .definitions import _DefaultModel, _DefaultOutput, _DefaultSurface, _DefaultVendorDependent
   from .seldomUsedFunctions import tareDepthForce, analyseDrift
 
@@ -76,6 +76,8 @@ class Indentation:
     # define all attributes
     self.testName, self.testList = None, None
     self.h, self.t, self.p, self.valid       = [],[],[],[]
+    self._hValid, self._pValid = None, None                 #cache of h[valid], p[valid]: see hValid, pValid
+    self._testEpoch, self._k2pEpoch = 0, 0                  #increased by nextTest, analyse; epoch k2p was computed
     self.hRaw = []
     self.slope, self.k2p, self.hc, self.Ac = [],[],[],[]
     self.modulus, self.modulusRed, self.hardness = [],[],[]
@@ -140,6 +142,61 @@ class Indentation:
     return
 
 
+  def __setattr__(self, name, value):
+    """
+    Set attribute; (re-)assigning h, p or valid (incl. h-=...) invalidates the cached valid data |br|
+    in-place element writes (e.g. valid[i:j]=True) are not detected: call _invalidateValid afterwards
+
+    Args:
+      name (str): name of attribute
+      value (any): new value
+    """
+    if name in ('h','p','valid'):
+      self._invalidateValid()
+    super().__setattr__(name, value)
+
+
+  def _invalidateValid(self):
+    """
+    Drop the cached valid data hValid, pValid: call after in-place element writes to h, p or valid
+    """
+    self.__dict__['_hValid'] = None
+    self.__dict__['_pValid'] = None
+    return
+
+
+  # hValid, pValid are cached: in-place element writes to h, p or valid (e.g. p[:i]=...) are not tracked
+  #   and must be followed by _invalidateValid(), otherwise stale masked data is returned
+  @property
+  def hValid(self):
+    """
+    Depth of valid data points h[valid]: cached until h or valid are reassigned or _invalidateValid is
+    called; in-place element writes to h or valid are not detected and the returned array must not be
+    changed in-place
+
+    Returns:
+      numpy.array: depth [um]
+    """
+    if self._hValid is None:
+      self._hValid = np.asarray(self.h)[self.valid]
+    return self._hValid
+
+
+  @property
+  def pValid(self):
+    """
+    Force of valid data points p[valid]: cached until p or valid are reassigned or _invalidateValid is
+    called; in-place element writes to p or valid are not detected and the returned array must not be
+    changed in-place
+
+    Returns:
+      numpy.array: force [mN]
+    """
+    if self._pValid is None:
+      self._pValid = np.asarray(self.p)[self.valid]
+    return self._pValid
+
+
   #defining an iterator for cleaner usage
   #https://www.programiz.com/python-programming/iterator
   #Building Custom Iterators
@@ -3,8 +3,9 @@ import numpy as np
 import matplotlib.pyplot as plt
 from scipy.signal import savgol_filter#, medfilt
 from scipy import interpolate
-import lmfit
+from scipy.optimize import lsq_linear
 from .definitions import Method
+from .theory import _linearFit
 
 def calibration(self,eTarget=72.0,numPolynomial=3,critDepthStiffness=1.0, critForce=1.0, critDepthTip=0.0, plotStiffness=False, plotTip=False, **kwargs):
   """
@@ -33,16 +34,16 @@ def calibration(self,eTarget=72.0,numPolynomial=3,critDepthStiffness=1.0, critFo
   ## re-create data-frame of all files
   self.restartFile()
   self.tip.compliance = frameCompliance
-  slope, h, p = np.array([], dtype=np.float64), np.array([],dtype=np.float64), np.array([],dtype=np.float64)
+  slope, h, p = [], [], []                  #collect per test, join once after all tests
   if self.method==Method.CSM:
     self.nextTest(newTest=False)  #rerun to ensure that onlyLoadingSegment used
     while True:
       if self.output['progressBar'] is not None:
         self.output['progressBar'](1-len(self.testList)/len(self.allTestList), 'calibration1' )
       self.analyse()
-      slope = np.hstack((slope, self.slope))
-      h     = np.hstack((h,     self.h[self.valid]))
-      p     = np.hstack((p,     self.p[self.valid]))
+      slope.append(self.slope)
+      h.append(self.hValid)
+      p.append(self.pValid)
       if not self.testList:
         break
       self.nextTest()
@@ -51,12 +52,13 @@ def calibration(self,eTarget=72.0,numPolynomial=3,critDepthStiffness=1.0, critFo
       if self.output['progressBar'] is not None:
         self.output['progressBar'](1-len(self.testList)/len(self.allTestList), 'calibration2')
       self.analyse()
-      slope = np.hstack((slope, self.metaUser['S_mN/um']))
-      h     = np.hstack((h,     self.metaUser['hMax_um']))
-      p     = np.hstack((p,     self.metaUser['pMax_mN']))
+      slope.append(self.metaUser['S_mN/um'])
+      h.append(self.metaUser['hMax_um'])
+      p.append(self.metaUser['pMax_mN'])
       if len(self.testList)==0:
         break
       self.nextTest()
+  slope, h, p = np.concatenate(slope), np.concatenate(h), np.concatenate(p)
 
   #depth has to be positive
   mask = h>critDepthTip
@@ -89,27 +91,29 @@ def calibration(self,eTarget=72.0,numPolynomial=3,critDepthStiffness=1.0, critFo
     # hc = hc[hc>0.001]
     if constantTerm:
       appendix = 'isoPlusConstant'
+      def fitFunct(params):     #error function
+        self.tip.prefactors = [params[x].value for x in params]+[appendix]
+        tempArea = self.tip.areaFunction(hc)          #use all datapoints as critDepth is for compliance plot
+        residual     = np.abs(Ac-tempArea)/len(Ac)    #normalize by number of points
+        return residual
+      # Parameters, 'value' = initial condition, 'min' and 'max' = boundaries
+      import lmfit
+      params = lmfit.Parameters()
+      params.add('m0', value= 24.3, min=10.0, max=60.0)
+      for idx in range(1,numPolynomial):
+        startVal = np.power(100,idx)
+        params.add('m'+str(idx), value= startVal/1000, min=-startVal*100, max=startVal*100)
+      params.add('c',  value= 20, min=0.5, max=300.0) ##all prefactors are in nm, this has to be too
+      # do fit, here with leastsq model; args=(hc, Ac)
+      result = lmfit.minimize(fitFunct, params, max_nfev=10000)
+      self.tip.prefactors = [result.params[x].value for x in result.params]+[appendix]
+      stderr = [result.params[x].stderr for x in result.params]
     else:
       appendix = 'iso'
-    def fitFunct(params):     #error function
-      self.tip.prefactors = [params[x].value for x in params]+[appendix]
-      tempArea = self.tip.areaFunction(hc)          #use all datapoints as critDepth is for compliance plot
-      residual     = np.abs(Ac-tempArea)/len(Ac)    #normalize by number of points
-      return residual
-    # Parameters, 'value' = initial condition, 'min' and 'max' = boundaries
-    params = lmfit.Parameters()
-    params.add('m0', value= 24.3, min=10.0, max=60.0)
-    for idx in range(1,numPolynomial):
-      startVal = np.power(100,idx)
-      params.add('m'+str(idx), value= startVal/1000, min=-startVal*100, max=startVal*100)
-    if constantTerm:
-      params.add('c',  value= 20, min=0.5, max=300.0) ##all prefactors are in nm, this has to be too
-    # do fit, here with leastsq model; args=(hc, Ac)
-    result = lmfit.minimize(fitFunct, params, max_nfev=10000)
-    self.tip.prefactors = [result.params[x].value for x in result.params]+[appendix]
+      prefactors, stderr = _fitIsoArea(hc, Ac, numPolynomial)
+      self.tip.prefactors = prefactors+[appendix]
     print("\nTip shape:")
-    print("  iterated prefactors",[round(i,1) for i in self.tip.prefactors[:-1]])
-    stderr = [result.params[x].stderr for x in result.params]
+    print("  iterated prefactors",[round(i,1) for i in self.tip.coefficients])
     print("    standard error",['NaN' if x is None else round(x,2) for x in stderr])
 
   if plotTip:
@@ -131,6 +135,30 @@ def calibration(self,eTarget=72.0,numPolynomial=3,critDepthStiffness=1.0, critFo
   return True
 
 
+def _fitIsoArea(hc, Ac, numPolynomial):
+  """
+  Fit iso area function to contact depth and area |br|
+  the area function is linear in its prefactors: bounded linear least-squares with the bounds of the lmfit
+  parameters; standard error scaled by residual variance as lmfit
+
+  Args:
+    hc (np.array): contact depth [um]
+    Ac (np.array): contact area [um2]
+    numPolynomial (int): number of area function prefactors
+
+  Returns:
+    list: prefactors, standard errors
+  """
+  hcNm   = np.maximum(hc*1000., 1.e-3)                                  #as in areaFunction
+  design = np.power.outer(hcNm, 2./np.power(2., np.arange(numPolynomial)))/1.e6    #[um^2] per prefactor
+  bound  = np.array([60.0]+[np.power(100.,idx)*100 for idx in range(1,numPolynomial)])
+  bound  = (np.hstack(([10.0], -bound[1:])), bound)
+  result = lsq_linear(design, Ac, bounds=bound)
+  residual = Ac-np.dot(design, result.x)
+  covariance = np.dot(residual,residual)/(len(Ac)-numPolynomial)*np.linalg.pinv(np.dot(design.T, design))
+  return result.x.tolist(), np.sqrt(np.diag(covariance)).tolist()
+
+
 def calibrateStiffness(self,critDepth=0.5,critForce=0.0001,plotStiffness=True, returnData=False):
   """
   Calibrate by first frame-stiffness from K^2/P of individual measurement
@@ -147,20 +175,17 @@ def calibrateStiffness(self,critDepth=0.5,critForce=0.0001,plotStiffness=True, r
   print("Start compliance fitting")
   ## output representative values
   if self.method==Method.CSM:
-    x, y, h = None, None, None
+    x, y, h = [], [], []                    #collect per test, join once after all tests
     while True:
       self.analyse()
-      if x is None:
-        x = 1./np.sqrt(self.p[self.valid]-np.min(self.p[self.valid])+0.001) #add 1nm:prevent runtime error
-        y = 1./self.slope
-        h = self.h[self.valid]
-      elif np.count_nonzero(self.valid)>0:
-        x = np.hstack((x,    1./np.sqrt(self.p[self.valid]-np.min(self.p[self.valid])+0.001) ))
-        y = np.hstack((y,    1./self.slope))
-        h = np.hstack((h, self.h[self.valid]))
+      if not x or np.count_nonzero(self.valid)>0:
+        x.append(1./np.sqrt(self.pValid-np.min(self.pValid)+0.001)) #add 1nm:prevent runtime error
+        y.append(1./self.slope)
+        h.append(self.hValid)
       if not self.testList:
         break
       self.nextTest()
+    x, y, h = np.concatenate(x), np.concatenate(y), np.concatenate(h)
     mask = np.logical_and(h>critDepth, x<1./np.sqrt(critForce))
     if len(mask[mask])==0:
       print("WARNING too restrictive filtering, no data left. Use high penetration: 50% of force and depth")
@@ -173,13 +198,13 @@ def calibrateStiffness(self,critDepth=0.5,critForce=0.0001,plotStiffness=True, r
         self.output['progressBar'](1-len(self.testList)/len(self.allTestList), 'calibrateStiffness')
       self.analyse()
       if isinstance(self.metaUser['pMax_mN'], list):
-        pAll = pAll+list(self.metaUser['pMax_mN'])
-        hAll = hAll+list(self.metaUser['hMax_um'])
-        sAll = sAll+list(self.metaUser['S_mN/um'])
+        pAll.extend(self.metaUser['pMax_mN'])
+        hAll.extend(self.metaUser['hMax_um'])
+        sAll.extend(self.metaUser['S_mN/um'])
       else:
-        pAll = pAll+[self.metaUser['pMax_mN']]
-        hAll = hAll+[self.metaUser['hMax_um']]
-        sAll = sAll+[self.metaUser['S_mN/um']]
+        pAll.append(self.metaUser['pMax_mN'])
+        hAll.append(self.metaUser['hMax_um'])
+        sAll.append(self.metaUser['S_mN/um'])
       if not self.testList:
         break
       self.nextTest()
@@ -196,7 +221,7 @@ def calibrateStiffness(self,critDepth=0.5,critForce=0.0001,plotStiffness=True, r
     print("ERROR too much filtering, no data left. Decrease critForce and critDepth")
     return None
 
-  param, covM = np.polyfit(x[mask],y[mask],1, cov=True)
+  param, covM = _linearFit(x[mask],y[mask], cov=True)
   print("fit f(x)=",round(param[0],5),"*x+",round(param[1],5))
   frameStiff = 1./param[1]
   frameCompliance = param[1]
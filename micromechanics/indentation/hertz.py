@@ -1,4 +1,5 @@
 """All functions relating to the Hertz equation for contact of sphere and flat surface"""
+from bisect import bisect_left, insort
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.optimize import curve_fit
@@ -82,38 +83,49 @@ def popIn(self, correctH=True, plot=True, removeInitialNM=2.):
   maxPlasticFit = 150
   minElasticFit = 0.01
 
-  mask = (self.h[self.valid]-np.min(self.h[self.valid]))  >removeInitialNM/1.e3
-  h = self.h[self.valid][mask]
-  p = self.p[self.valid][mask]
-
-  depthRate = h[1:]-h[:-1]
-  x_        = np.arange(len(depthRate))
-  fits      = np.polyfit(x_,depthRate,2)  #substract 2nd order fit b/c depthRate increases over time
-  depthRate-= np.polyval(fits,x_)
+  mask = (self.hValid-np.min(self.hValid))  >removeInitialNM/1.e3
+  h = self.hValid[mask]
+  p = self.pValid[mask]
+
+  depthRate = np.diff(h)
+  #substract 2nd order fit b/c depthRate increases over time
+  #  least-squares by normal equations in t=x/m on [0,1] (well conditioned): sums of t^k over x=0..m are known
+  #  in closed form; lstsq: singular for less than 3 rates, then minimum-norm solution as np.polyfit
+  m         = len(depthRate)-1.
+  scale     = max(m, 1.)
+  t_        = np.arange(len(depthRate), dtype=np.float64)/scale
+  sumX      = [m+1., m*(m+1.)/2., m*(m+1.)*(2.*m+1.)/6., (m*(m+1.)/2.)**2, \
+               m*(m+1.)*(2.*m+1.)*(3.*m*m+3.*m-1.)/30.]
+  sumT      = [sumX[k]/scale**k for k in range(5)]
+  sumTY     = [np.sum(depthRate), np.dot(t_,depthRate), np.dot(t_*t_,depthRate)]
+  fits      = np.linalg.lstsq([[sumT[4],sumT[3],sumT[2]], [sumT[3],sumT[2],sumT[1]], [sumT[2],sumT[1],sumT[0]]], \
+                              sumTY[::-1], rcond=None)[0]
+  trend     = np.multiply(t_, fits[0])    #Horner scheme: (a*t+b)*t+c
+  trend    += fits[1]
+  trend    *= t_
+  trend    += fits[2]
+  depthRate-= trend
   iJump     = np.argmax(depthRate)
   iMax      = min(np.argmax(p), iJump+maxPlasticFit)      #max for fit: 150 data-points or max. of curve
   iMin      = np.min(np.where(p>minElasticFit))
-  fitPlast  = np.polyfit(h[iJump+1:iMax],p[iJump+1:iMax],2) #does not have to be parabola, just close fit
-  slopePlast= np.polyder(np.poly1d(fitPlast))(h[iJump+1] )
+  #plastic part: parabola p=a*h^2+b*h+c by least-squares (does not have to be parabola, just close fit)
+  hPlast    = h[iJump+1:iMax]
+  vander    = np.column_stack((hPlast*hPlast, hPlast, np.ones_like(hPlast)))
+  fitPlast  = np.linalg.lstsq(vander, p[iJump+1:iMax], rcond=None)[0]  #also for less than 3 points
+  slopePlast= 2.*fitPlast[0]*h[iJump+1] + fitPlast[1]
   def funct(depth, prefactor, h0):
-    diff           = depth-h0
-    if isinstance(diff, np.float64):
-      diff = max(diff,0.0)
-    else:
-      diff[diff<0.0] = 0.0
-    return prefactor* (diff)**(3./2.)
-  fitElast, pcov = curve_fit(funct, h[iMin:iJump], p[iMin:iJump], p0=[100.,0.])    # pylint: disable=unbalanced-tuple-unpacking
+    diff           = np.maximum(depth-h0, 0.0)
+    return prefactor* diff*np.sqrt(diff)
+  def jacobian(depth, prefactor, h0):
+    diffSqrt       = np.sqrt(np.maximum(depth-h0, 0.0))
+    return np.column_stack((diffSqrt*diffSqrt*diffSqrt, -1.5*prefactor*diffSqrt))
+  fitElast, pcov = curve_fit(funct, h[iMin:iJump], p[iMin:iJump], p0=[100.,0.], jac=jacobian)    # pylint: disable=unbalanced-tuple-unpacking
   slopeElast= (funct(h[iJump],*fitElast) - funct(h[iJump]*0.9,*fitElast)) / (h[iJump]*0.1)
   fPopIn    = p[iJump]
   certainty = {"deltaRate":depthRate[iJump], "prefactor":fitElast[0], "h0":fitElast[1], \
                 "deltaSlope": slopeElast-slopePlast, 'deltaH':h[iJump+1]-h[iJump],\
                 "covElast":pcov[0,0] }
-  listDepthRate = depthRate.tolist()
-  iJump2 = np.argmax(listDepthRate)
-  while (iJump2-iJump)<3:
-    del listDepthRate[iJump2]
-    iJump2 = np.argmax(listDepthRate)
-  certainty["secondRate"] = np.max(listDepthRate)
+  certainty["secondRate"] = _secondRate(depthRate, iJump)
   if plot:
     _, ax1 = plt.subplots()
     ax2 = ax1.twinx()
@@ -130,3 +142,24 @@ def popIn(self, correctH=True, plot=True, removeInitialNM=2.):
   if correctH:
     self.h -= certainty["h0"]
   return fPopIn, certainty
+
+
+def _secondRate(depthRate, iJump):
+  """
+  Height of second largest jump in depth rate |br|
+  same as repeatedly deleting the maximum from the list of rates until the maximum is at least 3 positions
+  after iJump; positions are those in the shortened list (after deletions)
+
+  Args:
+    depthRate (numpy.array): depth rate
+    iJump (int): index of largest jump
+
+  Returns:
+    float: second largest depth rate
+  """
+  deleted = []                                          #sorted indices of deleted rates
+  for idx in np.argsort(-depthRate, kind='stable'):     #descending; ties: first index as in argmax
+    if idx-bisect_left(deleted, idx)-iJump >= 3:        #position in the shortened list
+      return depthRate[idx]
+    insort(deleted, idx)
+  raise ValueError('no second jump in depth rate')
@@ -1,6 +1,7 @@
 """All instrument specific input functions"""
 import io, re, json
 from pathlib import Path
+from itertools import islice
 from zipfile import ZipFile
 import h5py
 import numpy as np
@@ -21,9 +22,12 @@ def loadAgilent(self, fileName):
   self.testList = []
   self.fileName = fileName    #one file can have multiple tests
   self.indicies = {}
+  if isinstance(getattr(self, 'datafile', None), pd.ExcelFile):
+    self.datafile.close()                  #release workbook of previous file
+  self.datafile = pd.ExcelFile(fileName)   #open workbook once; sheets are parsed on demand
   for sheetName in ['Required Inputs', 'Pre-Test Inputs']:
     try:
-      workbook = pd.read_excel(fileName,sheet_name=sheetName)
+      workbook = self.datafile.parse(sheetName)
       self.metaVendor.update( dict(workbook.iloc[-1]) )
       break
     except:
@@ -31,7 +35,6 @@ def loadAgilent(self, fileName):
   if 'Poissons Ratio' in self.metaVendor and self.metaVendor['Poissons Ratio']!=self.nuMat and \
       self.output['verbose']>0:
     print("*WARNING*: Poisson Ratio different than in file.",self.nuMat,self.metaVendor['Poissons Ratio'])
-  self.datafile = pd.read_excel(fileName, sheet_name=None)
   tagged = []
   code = {"Load On Sample":"p", "Force On Surface":"p", "LOAD":"p", "Load":"p"\
         ,"_Load":"pRaw", "Raw Load":"pRaw","Force":"pRaw"\
@@ -56,15 +59,15 @@ def loadAgilent(self, fileName):
   self.fullData = ['h','p','t','pVsHSlope','hRaw','pRaw','tTotal','slopeSupport']
   if self.output['verbose']>1:
     print("Open Agilent file: "+fileName)
-  for idx, dfName in enumerate(self.datafile.keys()):
+  sheetNames = self.datafile.sheet_names
+  for idx, dfName in enumerate(sheetNames):
     if self.output['progressBar'] is not None:
-      self.output['progressBar'](int(idx/len(self.datafile)*100), 'load')
-    df    = self.datafile.get(dfName)
+      self.output['progressBar'](int(idx/len(sheetNames)*100), 'load')
     if "Test " in dfName and not "Tagged" in dfName and not "Test Inputs" in dfName:
       self.testList.append(dfName)
       #print "  I should process sheet |",sheet.name,"|"
-      if len(self.indicies)==0:               #find index of colums for load, etc
-        for cell in df.columns:
+      if len(self.indicies)==0:               #find index of colums for load, etc: header of first test is enough
+        for cell in self.datafile.parse(dfName, nrows=0).columns:
           if cell in code:
             self.indicies[code[cell]] = cell
             if self.output['verbose']>2:
@@ -113,29 +116,22 @@ def nextAgilentTest(self, newTest=True):
     self.testName = self.testList.pop(0)
 
   #read data and identify valid data points
-  df     = self.datafile.get(self.testName)
-  h       = np.array(df[self.indicies['h'    ]][1:-1], dtype=np.float64)
-  validFull = np.isfinite(h)
+  if self.datafile is None:                #closed after the last test: reopen, e.g. after restartFile
+    self.datafile = pd.ExcelFile(self.fileName)
+  df     = self.datafile.parse(self.testName)
+  if len(self.testList)==0:                #last test read: release workbook
+    self.datafile.close()
+    self.datafile = None
+  names  = list(self.indicies)
+  data   = df[list(self.indicies.values())].iloc[1:-1].to_numpy(dtype=np.float64)  #all used columns at once
+  validFull = np.isfinite(data[:,names.index('h')])
+  self.valid = np.logical_and(np.isfinite(data), data<1e99).all(axis=1)
   if 'slope' in self.indicies:
-    slope   = np.array(df[self.indicies['slope']][1:-1], dtype=np.float64)
-    self.valid =  np.isfinite(slope)
-    self.valid[self.valid] = slope[self.valid] > 0.0  #only valid points if stiffness is positiv
-  else:
-    self.valid = validFull
-  for index in self.indicies:
-    data = np.array(df[self.indicies[index]][1:-1], dtype=np.float64)
-    mask = np.isfinite(data)
-    mask[mask] = data[mask]<1e99
-    self.valid = np.logical_and(self.valid, mask)                       #adopt/reduce mask continously
-
-  #Run through all items again and crop to only valid data
-  for index in self.indicies:
-    data = np.array(df[self.indicies[index]][1:-1], dtype=np.float64)
-    if not index in self.fullData:
-      data = data[self.valid]
-    else:
-      data = data[validFull]
-    setattr(self, index, data)
+    self.valid &= data[:,names.index('slope')] > 0.0  #only valid points if stiffness is positiv
+
+  #crop to only valid data
+  for j, index in enumerate(names):
+    setattr(self, index, data[validFull if index in self.fullData else self.valid, j])
 
   self.valid = self.valid[validFull]
   #  now all fields (incl. p) are full and defined
@@ -157,7 +153,9 @@ def nextAgilentTest(self, newTest=True):
   if 'hc' in self.indicies         : self.hc /= 1.e3  #from nm in um
   if 'hRaw' in self.indicies        : self.hRaw /= 1.e3  #from nm in um
   if not "k2p" in self.indicies and 'slope' in self.indicies:
-    self.k2p = self.slope * self.slope / self.p[self.valid]
+    self.k2p = self.slope * self.slope / self.pValid
+  if "k2p" in self.indicies or 'slope' in self.indicies:  #k2p read or computed for this test
+    self._k2pEpoch = self._testEpoch  # pylint: disable=protected-access
   return True
 
 
@@ -173,7 +171,6 @@ def loadHysitron(self, fileName, plotContact=False):
     bool: success
 
   """
-  from io import StringIO
   self.fileName = fileName
   with open(self.fileName, 'r',encoding='iso-8859-1') as inFile:
     #### HLD FILE ###
@@ -226,28 +223,21 @@ def loadHysitron(self, fileName, plotContact=False):
 
       #read approach data
       line = inFile.readline() #Time_s  MotorDisp_mm    Piezo Extension_nm"
-      data = ""
-      for idx in range(int(value)):
-        data +=inFile.readline()
+      for _ in range(int(value)):  #approach data is not used
+        inFile.readline()
 
-      #read drift data
+      #read drift data: numeric blocks are read straight from the file, exactly the number of lines given
       value = inFile.readline().split(":")[1]
       line = inFile.readline()  #Time_s	Disp_nm",value
-      data = ""
-      for idx in range(int(value)):
-        data +=inFile.readline()
-      if len(data)>1:
-        self.dataDrift = np.loadtxt( StringIO(str(data))  )
+      if int(value)>0:
+        self.dataDrift = np.loadtxt( islice(inFile, int(value)), ndmin=2 )
         self.dataDrift[:,1] /= 1.e3  #into um
 
       #read test data
       #Time_s	Disp_nm	Force_uN	LoadCell_nm	PiezoDisp_nm	Disp_V	Force_V	Piezo_LowV
       value = inFile.readline().split(":")[1]
       line = inFile.readline()
-      data = ""
-      for idx in range(int(value)):
-        data +=inFile.readline()
-      dataTest = np.loadtxt( StringIO(str(data))  )
+      dataTest = np.loadtxt( islice(inFile, int(value)) )
       #store data
       self.t = dataTest[:,0]
       self.h = dataTest[:,1]/1.e3
@@ -262,13 +252,10 @@ def loadHysitron(self, fileName, plotContact=False):
       segmentPoints[0]+=1
       segPnts   = np.cumsum(segmentPoints)
       #don't use identifyLoadHoldUnload since those points are known
-      self.iLHU = []
-      for idxLoad, idxUnload in zip(listLoading, listUnload):
-        iSurface = segPnts[idxLoad-1]+1
-        iLoad    = segPnts[idxLoad]
-        iHold    = segPnts[idxUnload-1]+1
-        iUnload  = segPnts[idxUnload]
-        self.iLHU.append( [iSurface,iLoad,iHold,iUnload] )
+      numCycles   = min(len(listLoading), len(listUnload))
+      listLoading, listUnload = listLoading[:numCycles], listUnload[:numCycles]
+      self.iLHU = np.column_stack((segPnts[listLoading-1]+1, segPnts[listLoading], \
+                                   segPnts[listUnload-1]+1,  segPnts[listUnload])).tolist()
 
     #### TXT FILE ###
     if self.fileName.endswith('.txt'):
@@ -295,6 +282,7 @@ def loadHysitron(self, fileName, plotContact=False):
     idxMinH  = np.argmin(self.h)
     self.p[:idxMinH] = self.p[idxMinH]
     self.h[:idxMinH] = self.h[idxMinH]
+    self._invalidateValid()        #in-place writes  # pylint: disable=protected-access
     idxMask = int( np.where(self.p>forceTreshold)[0][0])
     fractionMinH = 0.5
     hFraction    = (1.-fractionMinH)*self.h[idxMinH]+fractionMinH*self.h[idxMask]
@@ -321,6 +309,7 @@ def loadHysitron(self, fileName, plotContact=False):
       hZero        = np.polyval(fitInitLoad, pZero)
       ## idx = np.where(  self.p>(pZero+pNoise)  )[0][0] OLD SYSTEM NOT AS ACCURATE, better fitInitLoad
       if plotContact:
+        idx = int(np.argmax(self.p>pZero+pNoise))   #first point above noise: sets plot limits
         plt.axhline(pZero,c='g', label='pZero')
         plt.axhline(pZero+pNoise,c='g',linestyle='dashed', label='pNoise')
         plt.axvline(self.h[idxMinH],c='k')
@@ -426,6 +415,9 @@ def loadFischerScope(self,fileName):
   self.testList = []
   self.fileName = fileName
   block = None
+  def blockToFrame(block):
+    data = np.array(block)
+    return pd.DataFrame(data, columns=['F','h','t','HMu','HM'][:data.shape[1]], copy=False)
   with open(fileName,'r',encoding='iso-8859-1') as fIn:
     # read initial lines and initialialize
     line = fIn.readline()
@@ -439,18 +431,19 @@ def loadFischerScope(self,fileName):
     self.metaVendor['Indent_C'] = ' '.join( fIn.readline().split()[2:] )
     self.metaVendor['Indent_R'] = ' '.join( fIn.readline().split()[2:] )
     #read all lines after initial lines
+    pattern = re.compile(re.escape(identifier)+r"   \d\d\.\d\d\.\d\d\d\d  \d\d:\d\d:\d\d")
     for line in fIn:
-      pattern = identifier+r"   \d\d\.\d\d\.\d\d\d\d  \d\d:\d\d:\d\d"
-      dataInLine = line.replace(',','.').split()
-      dataInLine = [float(item) if isfloat(item) else None for item in dataInLine]
-      if re.match(pattern, line) is not None:
+      try:
+        dataInLine = [float(item) for item in line.replace(',','.').split()]
+      except ValueError:  #not a line of numbers
+        dataInLine = None
+      if dataInLine is not None:  #most lines are data points: skip all label tests
+        if len(dataInLine)==3 or len(dataInLine)==5:
+          block.append( dataInLine )
+      elif pattern.match(line) is not None:
         ## finish old individual measurement
         if block is not None:
-          if np.array(block).shape[1]==5:
-            df = pd.DataFrame(np.array(block), columns=['F','h','t','HMu','HM'] )
-          else:
-            df = pd.DataFrame(np.array(block), columns=['F','h','t'] )
-          self.workbook.append(df)
+          self.workbook.append(blockToFrame(block))
         ## start new  individual measurement
         block = []
         self.metaVendor['date'] += [' '.join(line.split()[-2:])]
@@ -479,14 +472,8 @@ def loadFischerScope(self,fileName):
       elif 'Epsilon =' in line:
         self.metaVendor['epsilon'] += [float(line.split()[-1])]
         self.metaVendor['fit range'] += [' '.join(line.split()[:-3])]
-      elif ( len(dataInLine)==3 or len(dataInLine)==5 ) and not None in dataInLine:
-        block.append( dataInLine )
     ## add last dataframe
-    if np.array(block).shape[1]==5:
-      df = pd.DataFrame(np.array(block), columns=['F','h','t','HMu','HM'] )
-    else:
-      df = pd.DataFrame(np.array(block), columns=['F','h','t'] )
-    self.workbook.append(df)
+    self.workbook.append(blockToFrame(block))
   if self.output['verbose']>2:
     print("Meta information:",self.metaVendor)
     print("Number of measurements read:",len(self.workbook))
@@ -603,39 +590,34 @@ def nextHDF5Test(self):
   else:
     print("**ERROR instrument not in terms.json", self.metaUser['measurementType'].split()[0])
 
-  #determine valid masks: loop through all entries and ensure that they all make sense
+  #read each entry once and determine valid masks: loop through all entries and ensure that they all make sense
   self.valid = None
+  columns = {}
   for key in nameDict:
     if key in ['__ignore__','__note__']:
       continue
-    for name, _ in nameDict[key]:
+    for name, multiplyer in nameDict[key]:
       if name in branch:
         data = np.array(branch[name], dtype=np.float64)
+        columns[key] = (name, multiplyer, data)
         mask = np.logical_and(np.isfinite(data), data<1e99)
         if self.valid is None:
           self.valid = mask
         else:
-          self.valid = np.logical_and(self.valid, mask) #adopt/reduce mask continuously
+          self.valid &= mask                        #adopt/reduce mask continuously
         if key=='slope':
-          self.valid = np.logical_and(self.valid, data>0.0)
+          self.valid &= data>0.0
         if key=='h':
-          validFull = np.isfinite(np.array(branch[name], dtype=np.float64))
+          validFull = np.isfinite(data)
         break
 
-  #Run through all items again and crop to only valid data
-  for key in nameDict:
-    if key in ['__ignore__','__note__']:
-      continue
-    for name, multiplyer in nameDict[key]:
-      if name in branch:
-        data = np.array(branch[name], dtype=np.float64)
-        if key in ['h','p','t']:
-          data = data[validFull]
-        else:
-          data = data[self.valid]
-        setattr(self, key, data*multiplyer)
-        inFile.remove(name)
-        break
+  #crop to only valid data
+  for key, (name, multiplyer, data) in columns.items():
+    data = data[validFull] if key in ['h','p','t'] else data[self.valid]
+    setattr(self, key, data*multiplyer)
+    inFile.remove(name)
+  if 'k2p' in columns:                              #k2p read for this test
+    self._k2pEpoch = self._testEpoch  # pylint: disable=protected-access
 
   # Test if essential items exist
   for attrib in ['h','t','p']:
@@ -651,11 +633,12 @@ def nextHDF5Test(self):
   if converter == 'hap2hdf.py':
     ## Old and correct approach
     #Fischer-Scope reset the time multiple times
-    resetPoints = np.where((self.t[1:]-self.t[:-1])<0)[0]
-    if len(resetPoints)>0:
-      self.t = self.t[resetPoints[-1]:]
-      self.h = self.h[resetPoints[-1]:]
-      self.p = self.p[resetPoints[-1]:]
+    timeReset = self.t[1:]<self.t[:-1]                        #only the last reset is needed: search from the end
+    if timeReset.any():
+      lastReset = len(timeReset)-1-np.argmax(timeReset[::-1])
+      self.t = self.t[lastReset:]
+      self.h = self.h[lastReset:]
+      self.p = self.p[lastReset:]
       self.valid = np.ones_like(self.t, dtype=bool)
     ##Wrong approach: crop off neg. depth
     # mask = np.array(self.h)>=0
@@ -681,23 +664,6 @@ def nextHDF5Test(self):
   return True
 
 
-def isfloat(value):
-  """
-  Determine if value is float
-
-  Args:
-    value (float): number to be tested
-
-  Returns:
-    bool: result
-  """
-  try:
-    float(value)
-    return True
-  except ValueError:
-    return False
-
-
 def restartFile(self):
   """
   Restart processing the current file by resetting all values back to the initial
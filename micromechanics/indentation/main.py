@@ -3,11 +3,52 @@
 import traceback
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy import ndimage
 from scipy import signal
 from scipy.ndimage import gaussian_filter1d
-from scipy.optimize import fmin_l_bfgs_b
+from scipy.optimize import minimize_scalar
 from .definitions import Vendor, Method
+try:
+  from numba import njit
+except ImportError:
+  njit = None
+
+
+if njit is not None:
+  @njit(cache=True)
+  def _keepLongRun(result, start, end, size, border):
+    """
+    Opening of one run [start,end) of True (numba compiled): keep it if long enough after border clearing
+    """
+    first, last = max(start, border[0]), min(end, border[1])
+    if start>=0 and last-first>=size:
+      result[first:last] = True
+
+  @njit(cache=True, boundscheck=False)
+  def _closeOpenMaskScan(mask, size):
+    """
+    Binary closing followed by binary opening in one forward scan (numba compiled); see _closeOpenMask
+    """
+    numPoints = len(mask)
+    result = np.zeros(numPoints, dtype=np.bool_)
+    border = (size//2, numPoints-(size-1-size//2))     #erosion clears the border
+    runStart, runEnd = -1, -1                           #current run of True incl. filled short gaps
+    i = 0
+    while i<numPoints:
+      if not mask[i]:
+        i += 1
+        continue
+      start = i
+      while i<numPoints and mask[i]:
+        i += 1
+      if runStart>=0 and start-runEnd<size:             #closing: fill short gap
+        runEnd = i
+      else:
+        _keepLongRun(result, runStart, runEnd, size, border)
+        runStart, runEnd = start, i
+    _keepLongRun(result, runStart, runEnd, size, border)
+    return result
+else:
+  _keepLongRun, _closeOpenMaskScan = None, None
 
 
 def calcYoungsModulus(self, minDepth=-1, plot=False):
@@ -23,21 +64,21 @@ def calcYoungsModulus(self, minDepth=-1, plot=False):
       float: average Young's modulus, minDepth>0
   """
   self.modulusRed, self.Ac, self.hc = \
-    self.OliverPharrMethod(self.slope, self.p[self.valid], self.h[self.valid], self.model['nonMetal'])
+    self.OliverPharrMethod(self.slope, self.pValid, self.hValid, self.model['nonMetal'])
   modulus = self.YoungsModulus(self.modulusRed)
+  h = self.hValid
+  depthMask = h>minDepth
   if minDepth>0:
-    #eAve = np.average(       self.modulusRed[ self.h>minDepth ] )
-    eAve = np.average( modulus[  np.bitwise_and(modulus>0, self.h[self.valid]>minDepth) ] )
-    eStd = np.std(     modulus[  np.bitwise_and(modulus>0, self.h[self.valid]>minDepth) ] )
+    modulusDeep = modulus[ (modulus>0) & depthMask ]
+    eAve, eStd = modulusDeep.mean(), modulusDeep.std()
     print("Average and StandardDeviation of Young's Modulus",round(eAve,1) ,round(eStd,1) ,' [GPa]')
   else:
     eAve, eStd = -1, 0
   if plot:
-    h = self.h[self.valid]
     mark = '-' if len(modulus)>1 else 'o'
     if not self.modulus is None:
-      plt.plot(h[h>minDepth], self.modulus[h>minDepth], mark+'r', lw=3, label='read')
-    plt.plot(  h[h>minDepth], modulus[h>minDepth], mark+'b', label='calc')
+      plt.plot(h[depthMask], self.modulus[depthMask], mark+'r', lw=3, label='read')
+    plt.plot(  h[depthMask], modulus[depthMask], mark+'b', label='calc')
     if minDepth>0:
       plt.axhline(eAve, color='k')
       plt.axhline(eAve+eStd, color='k', linestyle='dashed')
@@ -52,25 +93,27 @@ def calcYoungsModulus(self, minDepth=-1, plot=False):
   return eAve
 
 
-def calcHardness(self, minDepth=-1, plot=False):
+def calcHardness(self, minDepth=-1, plot=False, Ac=None):
   """
   Calculate and plot Hardness as a function of the depth
 
   Args:
       minDepth (float): minimum depth for fitting horizontal; if negative: no line is fitted
       plot (bool): plot comparison this calculation to data read from file
+      Ac (numpy.array): contact area of the current data, e.g. just calculated by calcYoungsModulus;
+        None=use area function
   """
-  #use area function
-  hardness=self.p[self.valid]/self.OliverPharrMethod(self.slope, self.p[self.valid], self.h[self.valid], \
-    self.model['nonMetal'])[1]
+  if Ac is None:
+    Ac = self.OliverPharrMethod(self.slope, self.pValid, self.hValid, self.model['nonMetal'])[1]
+  hardness=self.pValid/Ac
   if plot:
     mark = '-' if len(hardness)>1 else 'o'
-    plt.plot(self.h[self.valid], hardness, mark+'b', label='calc')
+    plt.plot(self.hValid, hardness, mark+'b', label='calc')
     if not self.hardness is None:
-      plt.plot(self.h[self.valid], self.hardness, mark+'r', label='readFromFile')
+      plt.plot(self.hValid, self.hardness, mark+'r', label='readFromFile')
     if minDepth>0:
-      hardnessAve = np.average( hardness[  np.bitwise_and(hardness>0, self.h[self.valid]>minDepth) ] )
-      hardnessStd = np.std(     hardness[  np.bitwise_and(hardness>0, self.h[self.valid]>minDepth) ] )
+      hardnessDeep = hardness[ (hardness>0) & (self.hValid>minDepth) ]
+      hardnessAve, hardnessStd = hardnessDeep.mean(), hardnessDeep.std()
       print("Average and StandardDeviation of hardness",round(hardnessAve,1),round(hardnessStd,1) ,' [GPa]')
       plt.axhline(hardnessAve, color='b')
       plt.axhline(hardnessAve+hardnessStd, color='b', linestyle='dashed')
@@ -96,12 +139,16 @@ def calcStiffness2Force(self, minDepth=0.01, plot=True, calibrate=False):
   """
   compliance0 = self.tip.compliance
   prefactors = None
-  def errorFunction(compliance):
-    stiffness   = 1./(1./self.sRaw-compliance)
-    stiffness2load = np.divide(np.multiply(stiffness,stiffness),self.p)
+  def errorFunction(compliance, complianceRaw, buffer):
+    #stiffness^2/load in one reused buffer: 1/(1/S_raw-compliance), squared, divided by load
+    np.subtract(complianceRaw, compliance, out=buffer)
+    np.reciprocal(buffer, out=buffer)
+    np.square(buffer, out=buffer)
+    np.divide(buffer, self.p, out=buffer)
     h   = self.hRaw-compliance*self.p
-    h_ = h[ h>minDepth ]
-    stiffness2load  = stiffness2load[ h>minDepth ]
+    mask = h>minDepth
+    h_ = h[ mask ]
+    stiffness2load  = buffer[ mask ]
     if len(h_)>4:
       prefactors = np.polyfit(h_,stiffness2load,1)
       print(compliance,"Fit f(x)=",prefactors[0],"*x+",prefactors[1])
@@ -109,11 +156,13 @@ def calcStiffness2Force(self, minDepth=0.01, plot=True, calibrate=False):
     print("*WARNING*: too short vector",len(h_))
     return 9999999.
   if calibrate:
-    result = fmin_l_bfgs_b(errorFunction, compliance0, bounds=[(-0.1,0.1)], \
-                            approx_grad=True, epsilon=0.000001, factr=1e11)
-    print("  Best values   ",result[0], "\tOptimum residual:",np.round(result[1],3))
-    print('  Number of function evaluations~size of globalData',result[2]['funcalls'])
-    compliance0 = result[0]
+    complianceRaw = 1./self.sRaw                       #constant during optimization
+    buffer        = np.empty_like(complianceRaw, dtype=np.float64)
+    result = minimize_scalar(errorFunction, bounds=(-0.1,0.1), args=(complianceRaw, buffer), method='bounded',
+                             options={'xatol':1e-6})
+    print("  Best values   ",result.x, "\tOptimum residual:",np.round(result.fun,3))
+    print('  Number of function evaluations~size of globalData',result.nfev)
+    compliance0 = result.x
     #self.correct_H_S()
   if plot:
     stiffness = 1./(1./self.sRaw-compliance0)
@@ -141,6 +190,7 @@ def analyse(self):
   ONLY DO ONCE AFTER LOADING FILE: if this causes issues introduce flag analysed
     which is toggled during loading and analysing
   """
+  self._testEpoch += 1           # pylint: disable=protected-access
   self.h -= self.model['driftRate'] * self.t
   self.h -= self.tip.compliance * self.p
 
@@ -150,18 +200,76 @@ def analyse(self):
     self.slope, self.valid, _, _ , _= self.stiffnessFromUnloading(self.p, self.h)
     self.slope = np.array(self.slope)
   try:
-    self.k2p = self.slope*self.slope/self.p[self.valid]
+    self.k2p = self.slope*self.slope/self.pValid
+    self._k2pEpoch = self._testEpoch  # pylint: disable=protected-access
   except:
     print('**WARNING SKIP ANALYSE')
     print(traceback.format_exc())
     return
   #Calculate Young's modulus
   self.calcYoungsModulus()
-  self.calcHardness()
+  self.calcHardness(Ac=self.Ac)
   self.saveToUserMeta()
   return
 
 
+def _closeOpenMask(mask, size):
+  """
+  Binary closing followed by binary opening of a 1D mask with a flat structure of length size |br|
+  identical to scipy.ndimage (incl. border zeros) but only operates on the runs of True values:
+  fill gaps shorter than size, then remove runs shorter than size
+
+  Args:
+    mask (np.array): boolean mask
+    size (int): length of structuring element
+
+  Returns:
+    np.array: cleaned boolean mask
+  """
+  if _closeOpenMaskScan is not None:
+    return _closeOpenMaskScan(mask, size)
+  numPoints = len(mask)
+  edges = np.flatnonzero(np.diff(mask.view(np.int8), prepend=np.int8(0), append=np.int8(0)))
+  starts, ends = edges[::2], edges[1::2]              #runs of True: [start, end)
+  if len(starts)==0:
+    return np.zeros(numPoints, dtype=bool)
+  #closing: merge runs separated by short gaps; the erosion clears the border
+  keepGap = starts[1:]-ends[:-1] >= size
+  starts, ends = starts[np.r_[True, keepGap]], ends[np.r_[keepGap, True]]
+  np.maximum(starts, size//2, out=starts)
+  np.minimum(ends, numPoints-(size-1-size//2), out=ends)
+  #opening: remove short runs
+  longRun = ends-starts >= size
+  change = np.zeros(numPoints+1, dtype=np.int8)
+  change[starts[longRun]] = 1
+  change[ends[longRun]]   = -1
+  return np.cumsum(change[:-1]).astype(bool)
+
+
+def _histogram(values, low, high, numBins=1000):
+  """
+  Histogram of values in numBins equal bins between low and high |br|
+  identical counts and edges to np.histogram, but one bincount instead of a search per value
+
+  Args:
+    values (np.array): finite values within [low, high]
+    low (float): minimum of values
+    high (float): maximum of values
+    numBins (int): number of bins
+
+  Returns:
+    list: counts, bin edges
+  """
+  if low==high:
+    low, high = low-0.5, high+0.5
+  binEdges = np.linspace(low, high, numBins+1)
+  iBin     = ((values-low)/(high-low)*numBins).astype(np.intp)
+  np.minimum(iBin, numBins-1, out=iBin)
+  iBin    -= values<binEdges[iBin]                                  #round-off at bin edges
+  iBin    += (values>=binEdges[iBin+1]) & (iBin!=numBins-1)
+  return np.bincount(iBin, minlength=numBins), binEdges
+
+
 def identifyLoadHoldUnload(self,plot=False):
   """
   internal method: identify ALL load - hold - unload segments in data
@@ -196,12 +304,11 @@ def identifyLoadHoldUnload(self,plot=False):
     plt.title('Identify load, hold, unload: loading and unloading segments - prior to cleaning')
     plt.show()
   #try to clean small fluctuations
+  loadMaskTry, unloadMaskTry = loadMask, unloadMask
   if len(loadMask)>100 and len(unloadMask)>100:
     size = self.model['maxSizeFluctuations']
-    loadMaskTry = ndimage.binary_closing(loadMask, structure=np.ones((size,)) )
-    unloadMaskTry = ndimage.binary_closing(unloadMask, structure=np.ones((size,)))
-    loadMaskTry = ndimage.binary_opening(loadMaskTry, structure=np.ones((size,)))
-    unloadMaskTry = ndimage.binary_opening(unloadMaskTry, structure=np.ones((size,)))
+    loadMaskTry = _closeOpenMask(loadMask, size)
+    unloadMaskTry = _closeOpenMask(unloadMask, size)
   if np.any(loadMaskTry) and np.any(unloadMaskTry):
     loadMask = loadMaskTry
     unloadMask = unloadMaskTry
@@ -222,26 +329,25 @@ def identifyLoadHoldUnload(self,plot=False):
     ax[0].set_ylim([-8*self.model['relForceRateNoise'], 8*self.model['relForceRateNoise']])
     ax[0].legend()
     ax[0].set_ylabel(r'rate [$\mathrm{mN/sec}$]')
-  #find index where masks are changing from true-false
-  loadMask  = np.r_[False,loadMask,False] #pad with false on both sides
-  unloadMask= np.r_[False,unloadMask,False]
-  loadIdx   = np.flatnonzero(loadMask[1:]   != loadMask[:-1])
-  unloadIdx = np.flatnonzero(unloadMask[1:] != unloadMask[:-1])
+  #find index where masks are changing from true-false (padded with false on both sides)
+  loadIdx   = np.flatnonzero(np.diff(loadMask.view(np.int8),   prepend=np.int8(0), append=np.int8(0)))
+  unloadIdx = np.flatnonzero(np.diff(unloadMask.view(np.int8), prepend=np.int8(0), append=np.int8(0)))
   if len(unloadIdx) == len(loadIdx)+2 and np.all(unloadIdx[-4:]>loadIdx[-1]):
     #for drift: partial unload-hold-full unload
     unloadIdx = unloadIdx[:-2]
   while len(unloadIdx) < len(loadIdx) and loadIdx[2]<unloadIdx[0]:
     #clean loading front
     loadIdx = loadIdx[2:]
+  loadStart, loadEnd, unloadStart, unloadEnd = loadIdx[::2], loadIdx[1::2], unloadIdx[::2], unloadIdx[1::2]
 
   if plot or self.output['plotLoadHoldUnload']:     # verify visually
     ax[1].plot(self.p,'o')
     ax[1].plot(p, 's')
-    ax[1].plot(loadIdx[::2],  self.p[loadIdx[::2]],  'o',label='load',markersize=12)
-    ax[1].plot(loadIdx[1::2], self.p[loadIdx[1::2]], 'o',label='hold',markersize=10)
-    ax[1].plot(unloadIdx[::2],self.p[unloadIdx[::2]],'o',label='unload',markersize=8)
+    ax[1].plot(loadStart,  self.p[loadStart],  'o',label='load',markersize=12)
+    ax[1].plot(loadEnd,    self.p[loadEnd],    'o',label='hold',markersize=10)
+    ax[1].plot(unloadStart,self.p[unloadStart],'o',label='unload',markersize=8)
     try:
-      ax[1].plot(unloadIdx[1::2],self.p[unloadIdx[1::2]],'o',label='unload-end',markersize=6)
+      ax[1].plot(unloadEnd,self.p[unloadEnd],'o',label='unload-end',markersize=6)
     except IndexError:
       pass
     ax[1].legend(loc=0)
@@ -256,33 +362,32 @@ def identifyLoadHoldUnload(self,plot=False):
     print("**ERROR: Load-Hold-Unload identification did not work",loadIdx, unloadIdx  )
   else:
     self.output['successTest'].append(self.testName)
-  try:
-    for i,_ in enumerate(loadIdx[::2]):
-      if loadIdx[::2][i] < loadIdx[1::2][i] <= unloadIdx[::2][i] < unloadIdx[1::2][i]:
-        newEntry = [loadIdx[::2][i],loadIdx[1::2][i],unloadIdx[::2][i],unloadIdx[1::2][i]]
-        if np.min(newEntry)>0 and np.max(newEntry)<len(self.h):
-          self.iLHU.append(newEntry)
-        else:
-          print("**ERROR: iLHU values out of bounds", newEntry,' with length',len(self.h))
-          if len(self.iLHU)>0:
-            self.iLHU.append([])
-      else:
-        print("**ERROR: some segment not found", loadIdx[::2][i], loadIdx[1::2][i], unloadIdx[::2][i], unloadIdx[1::2][i])
-        if len(self.iLHU)>0:
-          self.iLHU.append([])
-  except:
+  numCycles = len(loadStart)
+  if min(len(loadEnd), len(unloadStart), len(unloadEnd)) < numCycles:
     print("**ERROR: load-unload-segment not found")
-    self.iLHU = []
+  else:
+    cycles  = np.column_stack((loadStart, loadEnd[:numCycles], unloadStart[:numCycles], unloadEnd[:numCycles]))
+    ordered = (cycles[:,0]<cycles[:,1]) & (cycles[:,1]<=cycles[:,2]) & (cycles[:,2]<cycles[:,3])
+    inBounds= (cycles.min(axis=1)>0) & (cycles.max(axis=1)<len(self.h))
+    success = ordered & inBounds
+    for iCycle in np.flatnonzero(~success):
+      if ordered[iCycle]:
+        print("**ERROR: iLHU values out of bounds", cycles[iCycle].tolist(),' with length',len(self.h))
+      else:
+        print("**ERROR: some segment not found", *cycles[iCycle])
+    #failed cycles after the first successful one are kept as empty placeholder
+    keep = np.cumsum(success)>0
+    self.iLHU = [cycle if good else [] for cycle, good in zip(cycles[keep].tolist(), success[keep])]
   if len(self.iLHU)>1:
     self.method=Method.MULTI
   #drift segments: only add if it makes sense
-  try:
-    iDriftS = unloadIdx[1::2][-1]+1
+  if len(unloadEnd)>0:
+    iDriftS = int(unloadEnd[-1])+1
     iDriftE = len(self.p)-1
     if iDriftS+1>iDriftE:
       iDriftS=iDriftE-1
     self.iDrift = [iDriftS,iDriftE]
-  except:
+  else:
     self.iDrift = [-1,-1]
   return True
 
@@ -298,26 +403,33 @@ def identifyLoadHoldUnloadCSM(self, plot=False):
   Returns:
     bool: success of identifying hold-load-unload sequence
   """
-  iSurface = np.min(np.where( self.h>=0                     ))
-  iLoad    = np.min(np.where( self.p-np.max(self.p)*self.model['unloadPMax']>0 ))
+  iSurface = np.argmax( self.h>=0 )       #first point in contact
+  if not self.h[iSurface]>=0:             #no point in contact
+    print('**ERROR identifyLoadHoldUnloadCSM: no surface contact')
+    self.iLHU = []
+    self.iDrift = []
+    return False
+  iHigh    = np.flatnonzero( self.p>np.max(self.p)*self.model['unloadPMax'] )  #indices close to max. force
+  iLoad    = iHigh[0]
   if iLoad<len(self.p)-1:
-    iHold  = np.max(np.where( self.p-np.max(self.p)*self.model['unloadPMax']>0 ))
+    iHold  = iHigh[-1]
     if iHold==iLoad:
       iHold += 1
-    try:
-      hist,bins= np.histogram( self.p[iHold:] , bins=1000)
-    except:
+    pAfterHold = self.p[iHold:]
+    #most frequent force after hold: upper edge of the fullest of 1000 equal bins (as np.histogram)
+    pLow, pHigh = (pAfterHold.min(), pAfterHold.max()) if len(pAfterHold)>0 else (np.nan, np.nan)
+    if not np.isfinite(pLow) or not np.isfinite(pHigh):  #empty or non-finite range
       print('**ERROR identifyLoadHoldUnloadCSM: 1')
       self.iLHU = []
       self.iDrift = []
       return False
-    pDrift   = bins[np.argmax(hist)+1]
-    pCloseToDrift = np.logical_and(self.p>pDrift*self.model['unloadPMax'], \
-                                   self.p<pDrift/self.model['unloadPMax'])
-    pCloseToDrift[:iHold] = False
-    if len(pCloseToDrift[pCloseToDrift])>3:
-      iDriftS  = np.min(np.where( pCloseToDrift ))
-      iDriftE  = np.max(np.where( pCloseToDrift ))
+    counts, binEdges = _histogram(pAfterHold, pLow, pHigh)
+    pDrift   = binEdges[counts.argmax()+1]
+    iCloseToDrift = np.flatnonzero(np.logical_and(pAfterHold>pDrift*self.model['unloadPMax'], \
+                                                  pAfterHold<pDrift/self.model['unloadPMax'])) + iHold
+    if len(iCloseToDrift)>3:
+      iDriftS  = iCloseToDrift[0]
+      iDriftE  = iCloseToDrift[-1]
     else:
       iDriftS   = len(self.p)-2
       iDriftE   = len(self.p)-1
@@ -341,8 +453,9 @@ def identifyLoadHoldUnloadCSM(self, plot=False):
     # constrain valid part to section between surface and maximum load
     slope = np.zeros_like(self.h)  #rebuild a large self.slope
     slope[self.valid] = self.slope #  and add current data to it
-    self.valid  = np.zeros_like(self.h, dtype=bool)
-    self.valid[iSurface:iLoad]  = True
+    valid = np.zeros_like(self.h, dtype=bool)
+    valid[iSurface:iLoad]  = True
+    self.valid  = valid            #assign after filling: in-place writes do not reset hValid, pValid
     self.slope  = slope[self.valid]
 
   if plot or self.output['plotLoadHoldUnload']:
@@ -369,6 +482,7 @@ def nextTest(self, newTest=True, plotSurface=False):
   Returns:
      bool: success of going to next sheet
   """
+  self._testEpoch += 1           # pylint: disable=protected-access
   if newTest:
     if self.vendor == Vendor.Agilent:
       success = self.nextAgilentTest(newTest)
@@ -438,6 +552,7 @@ def nextTest(self, newTest=True, plotSurface=False):
         """
         return z.nonzero()[0]
       thresValues[nans]= np.interp(tempX(nans), tempX(~nans), thresValues[~nans])
+      self._invalidateValid()      #thresValues can be self.p, written in-place  # pylint: disable=protected-access
 
       #filter this data
       if 'median filter' in self.surface:
@@ -481,15 +596,15 @@ def saveToUserMeta(self):
   if self.method == Method.CSM:
     if len(self.slope)>0:
       i = -1 # only last value is saved
-      meta = {"S_mN/um":[self.slope[i]], "hMax_um":[self.h[self.valid][i]], "pMax_mN":[self.p[self.valid][i]],\
+      meta = {"S_mN/um":[self.slope[i]], "hMax_um":[self.hValid[i]], "pMax_mN":[self.pValid[i]],\
               "modulusRed_GPa":[self.modulusRed[i]], "A_um2":[self.Ac[i]], "hc_um":[self.hc[i]],\
               "E_GPa":[self.modulus[i]],"H_GPa":[self.hardness[i]],"segment":[str(i+1)] }
     else:
       meta = {}
   else:
     segments = [str(i+1) for i in range(len(self.slope))]
-    meta = {"S_mN/um":list(self.slope), "hMax_um":list(self.h[self.valid]), \
-            "pMax_mN":list(self.p[self.valid]),"modulusRed_GPa":list(self.modulusRed),"A_um2":list(self.Ac),\
+    meta = {"S_mN/um":list(self.slope), "hMax_um":list(self.hValid), \
+            "pMax_mN":list(self.pValid),"modulusRed_GPa":list(self.modulusRed),"A_um2":list(self.Ac),\
             "hc_um":list(self.hc), "E_GPa":list(self.modulus),"H_GPa":list(self.hardness),"segment":segments}
   self.metaUser.update(meta)
   self.metaUser['code'] = __file__.rsplit('/', maxsplit=1)[-1]
@@ -3,6 +3,7 @@ import traceback
 import numpy as np
 import matplotlib.pyplot as plt
 from .definitions import Method
+from .theory import _linearFit
 
 def plotTestingMethod(self, saveFig=False, show=True, double=False):
   """
@@ -23,11 +24,9 @@ def plotTestingMethod(self, saveFig=False, show=True, double=False):
   ax1b = ax1.twinx()
   ax1.plot(self.t, self.p,'C0')
   ax1b.plot(self.t, self.h,'C1')
-  for mask in self.iLHU:
-    ax1.plot(self.t[mask][0], self.p[mask][0], 'C0s')
-    ax1.plot(self.t[mask][1], self.p[mask][1], 'C0x')
-    ax1.plot(self.t[mask][2], self.p[mask][2], 'C0+')
-    ax1.plot(self.t[mask][3], self.p[mask][3], 'C0o')
+  iLHU = np.asarray(self.iLHU, dtype=int).reshape(-1,4)   #one marker set per cycle: plot each column at once
+  for column, marker in enumerate(['C0s','C0x','C0+','C0o']):
+    ax1.plot(self.t[iLHU[:,column]], self.p[iLHU[:,column]], marker)
   ax1.plot(self.t[self.iDrift], self.p[self.iDrift], 'k.')
   ax1.axhline(0,color='C0', linestyle='dashed')
   ax1b.axhline(0,color='C1', linestyle='dashed')
@@ -36,14 +35,14 @@ def plotTestingMethod(self, saveFig=False, show=True, double=False):
   ax1.set_ylabel(r"force [$\mathrm{mN}$]", color='C0', fontsize=14)
   if double:
     ax2b = ax2.twinx()
-    ax2.plot(self.t[self.valid], self.slope,'C0')
-    ax2b.plot(self.t[self.valid], self.phase,'C1')
+    tValid = self.t[self.valid]
+    ax2.plot(tValid, self.slope,'C0')
+    ax2b.plot(tValid, self.phase,'C1')
     ax2.set_xlabel(r"time [$\mathrm{s}$]")
     ax2b.set_ylabel(r"phase [$\mathrm{rad}$]", color='C1', fontsize=14)
     ax2.set_ylabel(r"stiffness [$\mathrm{mN/\mu m}$]", color='C0', fontsize=14)
   plt.grid()
   plt.subplots_adjust(hspace=0)
-  plt.show()
   if saveFig:
     plt.savefig(self.fileName.split('.')[0]+".png", dpi=150, bbox_inches='tight')
   if show:
@@ -62,35 +61,37 @@ def plot(self, saveFig=False, show=True, plotAllItems=True):
   Returns:
     pyplot.axis: figure
   """
-  if len(self.slope)==1 and self.output['verbose']>1:
-    print("Stiffness:"+str(round(self.slope[0],1))     +"mN/um   "+\
-      "hMax:"+str(round(self.h[self.valid][0],4))+"um    pMax:"+str(round(self.p[self.valid][0],2))+"mN")
+  h, p, slope, hc = self.h, self.p, self.slope, self.hc
+  hValid, pValid  = self.hValid, self.pValid
+  if len(slope)==1 and self.output['verbose']>1:
+    print("Stiffness:"+str(round(slope[0],1))     +"mN/um   "+\
+      "hMax:"+str(round(hValid[0],4))+"um    pMax:"+str(round(pValid[0],2))+"mN")
     print("E*:       "+str(round(self.modulusRed[0],1))+"GPa     "+\
-      "A:   "+str(round(self.Ac[0],4))+          "um2    hc: "+str(round(self.hc[0],4))+"um")
+      "A:   "+str(round(self.Ac[0],4))+          "um2    hc: "+str(round(hc[0],4))+"um")
     print("E:        "+str(round(self.modulus[0],1))   +"GPa     "+\
       "H:   "+str(round(self.hardness[0],1))+     "GPa")
   plt.axhline(0,ls="dashed",c='k')
   plt.axvline(0,ls="dashed",c='k')
-  plt.plot(self.h,self.p)
+  plt.plot(h,p)
   if self.method != Method.CSM and plotAllItems:
-    _, _, maskUnload, optPar, _ = self.stiffnessFromUnloading(self.p, self.h)
-    h_, p_ = self.h[maskUnload], self.p[maskUnload]
+    _, _, maskUnload, optPar, _ = self.stiffnessFromUnloading(p, h)
+    hUnload, pUnload = h[maskUnload], p[maskUnload]
     if maskUnload is not None:
-      plt.plot(self.h[maskUnload], self.unloadingPowerFunc(self.h[maskUnload],*optPar), 'C1', label='fit powerlaw')
-    if len(self.h[self.valid])<101:  #allow for 100 unloading segments to be plotted
-      plt.plot(self.h[self.valid],self.p[self.valid],"or",label="evaluated", markersize=10)
-      plt.plot(self.hc, np.zeros_like(self.hc),"ob", label="hc", markersize=10)
-    if len(self.hc)==1:
-      plt.plot(h_[0],p_[0],'og',)
-      plt.plot(h_[-1],p_[-1],'og', label="fit domain")
+      plt.plot(hUnload, self.unloadingPowerFunc(hUnload,*optPar), 'C1', label='fit powerlaw')
+    if len(hValid)<101:  #allow for 100 unloading segments to be plotted
+      plt.plot(hValid,pValid,"or",label="evaluated", markersize=10)
+      plt.plot(hc, np.zeros_like(hc),"ob", label="hc", markersize=10)
+    if len(hc)==1:
+      plt.plot(hUnload[0],pUnload[0],'og',)
+      plt.plot(hUnload[-1],pUnload[-1],'og', label="fit domain")
       try:
         if self.model['evaluateSAtMax']:
-          stiffnessLineInterceptY = self.p[self.valid]-self.slope*self.h[self.valid]
-          h_ = np.linspace(self.hc,self.h[self.valid].max(),10)
+          stiffnessLineInterceptY = pValid-slope*hValid
+          h_ = np.linspace(hc,hValid.max(),10)
         else:
-          stiffnessLineInterceptY = self.p[maskUnload][0]-self.slope*self.h[maskUnload][0]
-          h_ = np.linspace(self.hc, self.h[maskUnload][0], 10)
-        plt.plot(h_,   self.slope*h_+stiffnessLineInterceptY, 'r--', lw=2, label='stiffness')
+          stiffnessLineInterceptY = pUnload[0]-slope*hUnload[0]
+          h_ = np.linspace(hc, hUnload[0], 10)
+        plt.plot(h_,   slope*h_+stiffnessLineInterceptY, 'r--', lw=2, label='stiffness')
       except:
         print('**Error something is wrong with plotting unloading-line')
         print(traceback.format_exc())
@@ -165,33 +166,37 @@ def plotAsDepth(self, entity, hvline=None, vmax=None, vmin=None):
     return
   if hvline is not None:
     plt.axhline(hvline, c='k')
+  hValid = self.hValid
   if   entity == "E":
-    plt.plot(self.h[self.valid], self.modulus, "o")
+    plt.plot(hValid, self.modulus, "o")
     plt.ylabel("Young's modulus [GPa]")
   elif entity == "modulusRed":
-    plt.plot(self.h[self.valid], self.modulusRed, "o")
+    plt.plot(hValid, self.modulusRed, "o")
     plt.ylabel("reduced Young's modulus [GPa]")
   elif entity == "H":
-    plt.plot(self.h[self.valid], self.hardness, "o")
+    plt.plot(hValid, self.hardness, "o")
     plt.ylabel("Hardness [GPa]")
   elif entity == "K":
-    plt.plot(self.h[self.valid], self.slope, "o")
+    plt.plot(hValid, self.slope, "o")
     plt.ylabel("Stiffness [kN/m]")
   elif entity == "K2P":
-    if not hasattr(self, 'k2p'):
-      self.k2p = np.array(self.slope)*np.array(self.slope)/np.array(self.p[self.valid])
-    plt.plot(self.h[self.valid], self.k2p, "C0o")
-    mask = self.h[self.valid]>0.1
-    fit = np.polyfit(self.h[self.valid][mask], self.k2p[mask],1)
+    if self._k2pEpoch!=self._testEpoch or len(self.k2p)!=len(hValid):  # pylint: disable=protected-access
+      #not set for this test / analysis: recalculate
+      slope = np.asarray(self.slope)                    #no copy if already an array
+      self.k2p = slope*slope/self.pValid
+      self._k2pEpoch = self._testEpoch                  # pylint: disable=protected-access
+    plt.plot(hValid, self.k2p, "C0o")
+    mask = hValid>0.1
+    fit = _linearFit(hValid[mask], self.k2p[mask])
     print('Fit: K2P='+str(round(fit[1]))+'+ '+str(round(fit[0]))+'*h')
-    plt.plot(self.h[self.valid], np.polyval(fit,self.h[self.valid]), 'C1-')
+    plt.plot(hValid, np.polyval(fit,hValid), 'C1-')
     plt.axvline(0.1, linestyle='dashed',color='C1')
     plt.ylabel(r"Stiffness Squared Over Load [$\mathrm{GPa}$]")
   elif entity == "hc":
-    plt.plot(self.h[self.valid], self.hc, "o")
+    plt.plot(hValid, self.hc, "o")
     plt.ylabel(r"Contact depth [$\mathrm{\mu m}$]")
   elif entity == "Ac":
-    plt.plot(self.h[self.valid], self.Ac, "o")
+    plt.plot(hValid, self.Ac, "o")
     plt.ylabel(r"Contact area [$\mathrm{\mu m^2}$]")
   else:
     print("Unknown entity")
@@ -24,10 +24,11 @@ def tareDepthForce(self, slopeThreshold=100, compareRead=False, plot=False):
     print("tareDepthForce only valid for ISO method of Agilent at this moment")
     return
   iSurface = np.min(np.where(self.pVsHSlope>slopeThreshold))#determine point of contact
-  h = self.hRaw   - self.hRaw[iSurface]                   #tare to point of contact
+  hTared = self.hRaw - self.hRaw[iSurface]               #tare to point of contact; kept for support
   p = self.pRaw   - self.pRaw[iSurface]
   t = self.tTotal - self.tTotal[iSurface]
-  h-= p/self.frameStiffness                               #compensate depth for instrument deflection
+  h = np.divide(p, self.frameStiffness)
+  np.subtract(hTared, h, out=h)                           #compensate depth for instrument deflection
   maskDrift = np.zeros_like(h, dtype=bool)
   maskDrift[self.iDrift[0]:self.iDrift[1]]   =  True
   tMiddle = (t[self.iDrift[1]]+t[self.iDrift[0]])/2
@@ -36,18 +37,16 @@ def tareDepthForce(self, slopeThreshold=100, compareRead=False, plot=False):
   driftRate        = (h[iDriftE]-h[iDriftS])/(t[iDriftE]-t[iDriftS])
   #calc. as rate between last and first point
   #  according to plot shown in J.Hay Univerisity part 3; fitting line would be different
-  print("Drift rate: %.3f nm/s"%(driftRate*1e3))
+  print(f"Drift rate: {driftRate*1e3:.3f} nm/s")
   h-= driftRate*t                                          #compensate thermal drift
-  #compensate supporting mechanism (use original data since h changed)
-  p-= self.slopeSupport*(self.hRaw-self.hRaw[iSurface])
+  #compensate supporting mechanism (use tared original depth since h changed; buffer not needed afterwards)
+  hTared *= self.slopeSupport
+  p-= hTared
   if compareRead:
     mask = self.h>0.010                                    #10nm
-    error = (h[mask]-self.h[mask])/self.h[mask]
-    print("Error in h: {0:.2f}%".format(np.linalg.norm(error)/len(error)*100.) )
-    error = (p[mask]-self.p[mask])/self.p[mask]
-    print("Error in p: {0:.2f}%".format(np.linalg.norm(error)/len(error)*100.) )
-    error = (t[mask]-self.t[mask])/self.t[mask]
-    print("Error in t: {0:.2f}%".format(np.linalg.norm(error)/len(error)*100.) )
+    for name, calc, read in (('h', h, self.h), ('p', p, self.p), ('t', t, self.t)):
+      error = (calc[mask]-read[mask])/read[mask]
+      print(f"Error in {name}: {np.linalg.norm(error)/len(error)*100.:.2f}%")
   if plot:
     _, ax1 = plt.subplots()
     ax2 = ax1.twinx()
@@ -81,38 +80,52 @@ def isFusedSilica(self, bounds=[[610,700],[71,73],[8.9,10.1]], numPoints=50):
   result = {'vendor':{ 'average':[],'in boundaries':[]},\
     'recalibration':{ 'average':[],'in boundaries':[]} }
 
+  def smoothStatistics(x, y, key):
+    """
+    smooth K2P, E, H over depth together and evaluate the last 50% against the bounds
+
+    Args:
+      x (np.array): depth of all tests
+      y (list): K2P, E, H of all tests
+      key (str): 'vendor' or 'recalibration' entry of result
+
+    Returns:
+      np.array, np.array: interpolation depths, smoothed K2P, E, H at these depths
+    """
+    # use interpolation function smoothing: one sort and one filter pass for all properties
+    data = np.vstack([x]+y)
+    data = data[:, data[0].argsort()]
+    windowSize = int(len(x)/numPoints) if int(len(x)/numPoints)%2==1 else int(len(x)/numPoints)-1
+    output = savgol_filter(data,windowSize,3)
+    smooth = interpolate.interp1d(output[0,:],output[1:,:] ,'linear', fill_value="extrapolate")
+    # calculate statistics
+    xSmooth = np.linspace(np.min(x), np.max(x), numPoints)
+    ySmooth = smooth(xSmooth)
+    yHigh   = ySmooth[:, xSmooth > np.max(xSmooth)/2]
+    boundsArray = np.array(bounds)
+    inBoundsAll = np.logical_and(boundsArray[:,:1]<=yHigh, yHigh<=boundsArray[:,1:]).mean(axis=1)
+    for j in range(3):
+      average = round(np.average(yHigh[j]),2)
+      result[key]['average'].append(average)
+      inBounds= round(inBoundsAll[j],2)
+      result[key]['in boundaries'].append(inBounds)
+      success = bounds[j][0]<=average and average<=bounds[j][1]
+      result[key]['success'] = success
+      print('  Average '+value[j]+':',average,'[GPa] in boundary:',round(inBounds*100),'%','success:',success)
+    return xSmooth, ySmooth
+
   #vendor data
   x, y = [],[[],[],[]]
   while True:
     for j in range(3):
-      ax[j].plot(self.h[self.valid],     getattr(self,value[j]), c='C0', alpha=0.3)
-      y[j] = np.concatenate((y[j], getattr(self,value[j])))
-    x    = np.concatenate((x,self.h[self.valid]))
+      ax[j].plot(self.hValid, getattr(self,value[j]), c='C0', alpha=0.3)
+      y[j].append(getattr(self,value[j]))
+    x.append(self.hValid)
     if len(self.testList)==0: break
     self.nextTest()
-  # create interpolating function
-  f1 = []
-  for j in range(3):
-    # use interpolation function smoothing
-    data = np.vstack((x,y[j]))
-    data = data[:, data[0].argsort()]
-    windowSize = int(len(x)/numPoints) if int(len(x)/numPoints)%2==1 else int(len(x)/numPoints)-1
-    output = savgol_filter(data,windowSize,3)
-    # save to array
-    f1.append(interpolate.interp1d(output[0,:],output[1,:] ,'linear', fill_value="extrapolate"))
-  # calculate statistics
-  x1   = np.linspace(np.min(x), np.max(x), numPoints)
-  mask = x1 > np.max(x1)/2
+  x, y = np.concatenate(x), [np.concatenate(i) for i in y]   #join all tests once
   print('\nVendor data (last 50%):')
-  for j in range(3):
-    average = round(np.average(f1[j](x1)[mask]),2)
-    result['vendor']['average'].append(average)
-    inBounds= np.logical_and( bounds[j][0]<=f1[j](x1)[mask], f1[j](x1)[mask]<=bounds[j][1] )
-    inBounds= round(inBounds.sum()*1.0 / len(inBounds),2)
-    result['vendor']['in boundaries'].append(inBounds)
-    success = bounds[j][0]<=average and average<=bounds[j][1]
-    result['vendor']['success'] = success
-    print('  Average '+value[j]+':',average,'[GPa] in boundary:',round(inBounds*100),'%','success:',success)
+  x1, y1 = smoothStatistics(x, y, 'vendor')
   print()
 
   #new calibration
@@ -123,34 +136,14 @@ def isFusedSilica(self, bounds=[[610,700],[71,73],[8.9,10.1]], numPoints=50):
   while True:
     self.analyse()
     for j in range(3):
-      ax[j].plot(self.h[self.valid], getattr(self,value[j]), c='C1', alpha=0.3)
-      y[j] = np.concatenate((y[j],   getattr(self,value[j])))
-    x    = np.concatenate((x, self.h[self.valid]))
+      ax[j].plot(self.hValid, getattr(self,value[j]), c='C1', alpha=0.3)
+      y[j].append(getattr(self,value[j]))
+    x.append(self.hValid)
     if len(self.testList)==0: break
     self.nextTest()
-  # create interpolating function
-  f2 = []
-  for j in range(3):
-    # use interpolation function smoothing
-    data = np.vstack((x,y[j]))
-    data = data[:, data[0].argsort()]
-    windowSize = int(len(x)/numPoints) if int(len(x)/numPoints)%2==1 else int(len(x)/numPoints)-1
-    output = savgol_filter(data,windowSize,3)
-    # save to array
-    f2.append(interpolate.interp1d(output[0,:],output[1,:] ,'linear', fill_value="extrapolate"))
-  # calculate statistics
-  x2   = np.linspace(np.min(x), np.max(x), numPoints)
-  mask = x2 > np.max(x2)/2
+  x, y = np.concatenate(x), [np.concatenate(i) for i in y]   #join all tests once
   print('\nRecalibration data (last 50%):')
-  for j in range(3):
-    average = round(np.average(f2[j](x2)[mask]),2)
-    result['recalibration']['average'].append(average)
-    inBounds= np.logical_and( bounds[j][0]<=f2[j](x2)[mask], f2[j](x2)[mask]<=bounds[j][1] )
-    inBounds= round(inBounds.sum()*1.0 / len(inBounds),2)
-    result['recalibration']['in boundaries'].append(inBounds)
-    success = bounds[j][0]<=average and average<=bounds[j][1]
-    result['recalibration']['success'] = success
-    print('  Average '+value[j]+':',average,'[GPa] in boundary:',round(inBounds*100),'%','success:',success)
+  x2, y2 = smoothStatistics(x, y, 'recalibration')
   print('\n')
 
   # add fake lines for legend
@@ -160,8 +153,8 @@ def isFusedSilica(self, bounds=[[610,700],[71,73],[8.9,10.1]], numPoints=50):
   ax[1].legend(loc=4)
   #plot avarages, bounds, format axis
   for j in range(3):
-    ax[j].plot(x1,f1[j](x1), linewidth=3,c='C0')
-    ax[j].plot(x2,f2[j](x2), linewidth=3,c='C1')
+    ax[j].plot(x1,y1[j], linewidth=3,c='C0')
+    ax[j].plot(x2,y2[j], linewidth=3,c='C1')
     ax[j].axhline(bounds[j][0] ,color='k',linewidth=2)
     ax[j].axhline(bounds[j][1], color='k',linewidth=2)
     ax[j].yaxis.tick_right()
@@ -201,12 +194,14 @@ def analyseDrift(self, plot=True, fraction=None, timeStart=None, duration=-1):
   if self.vendor == Vendor.Hysitron and self.fileName.endswith('.hld'):
     time = self.dataDrift[:,0]
     depth = self.dataDrift[:,1]
-    rate = np.zeros_like(time)
-    rate[:] = np.nan
-    for idxEnd,ti in enumerate(time):
-      if ti<20: continue
-      idxStart = np.argmin(np.abs( time[:]-(ti-20.) )  )
-      rate[idxEnd] = (depth[idxEnd]-depth[idxStart])/(time[idxEnd]-time[idxStart])
+    #rate over the last 20sec: time is sorted, hence closest start-index from its neighbors in searchsorted
+    target   = time-20.
+    idxRight = np.clip(np.searchsorted(time, target), 1, len(time)-1)
+    idxStart = np.where(np.abs(time[idxRight-1]-target) <= np.abs(time[idxRight]-target), idxRight-1, idxRight)
+    idxStart = np.searchsorted(time, time[idxStart])   #first of equal time stamps
+    mask     = time>=20
+    rate = np.full_like(time, np.nan)
+    rate[mask] = (depth[mask]-depth[idxStart[mask]])/(time[mask]-time[idxStart[mask]])
     idxEnd = np.argmin(np.abs( time[:]-(40.) )  )
     drift = rate[idxEnd]
   elif self.vendor == Vendor.Micromaterials and self.fileName.endswith('hdf5'):
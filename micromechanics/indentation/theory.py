@@ -4,8 +4,73 @@ import numpy as np
 import matplotlib.pylab as plt
 from scipy.optimize import curve_fit
 from .definitions import Method
+try:
+  from numba import njit
+except ImportError:
+  njit = None
 #import definitions
 
+_HALF_SQRT_PI = math.sqrt(math.pi)/2.  # stiffness = 2/sqrt(pi) sqrt(Ac) modulusRed
+
+
+if njit is not None:
+  @njit(cache=True, error_model='numpy')
+  def _oliverPharrIso(stiffness, pMax, h, prefactors, *, beta, hOffset):
+    """
+    Oliver-Pharr method for iso(PlusConstant) area functions in one pass over the arrays (numba compiled)
+
+    Args:
+       stiffness (numpy.array): stiffness = slope dP/dh
+       pMax (numpy.array): maximal force
+       h (numpy.array): total penetration depth
+       prefactors (numpy.array): prefactors of area function without type, [nm]
+       beta (float): beta times nonMetal
+       hOffset (float): constant added to contact depth of isoPlusConstant [nm]; 0 for iso
+
+    Returns:
+       list: modulusRed, Ac, hc, hardness
+    """
+    modulus, Ac, hc, hardness = np.empty_like(h), np.empty_like(h), np.empty_like(h), np.empty_like(h)
+    for i, depth in enumerate(h):
+      hc[i] = depth - beta*pMax[i]/stiffness[i]
+      hNm   = max(hc[i]*1000., 1.e-3)+hOffset
+      power = hNm*hNm
+      area  = prefactors[0]*power
+      for j in range(1, len(prefactors)):
+        power = math.sqrt(power)
+        area += prefactors[j]*power
+      Ac[i] = max(area/1.e6, 1.e-12)
+      modulus[i] = stiffness[i] / (2.0*math.sqrt(Ac[i])/math.sqrt(math.pi))
+      hardness[i] = pMax[i]/Ac[i]
+    return modulus, Ac, hc, hardness
+
+  @njit(cache=True)
+  def _unloadingPower(h, B, hf, m):
+    """
+    unloading power law p = B*(h-hf)^m in one pass (numba compiled); see unloadingPowerFunc
+    """
+    value = np.empty_like(h)
+    for i, depth in enumerate(h):
+      value[i] = B*(depth-hf)**m
+    return value
+
+  @njit(cache=True)
+  def _unloadingPowerJac(h, B, hf, m):
+    """
+    Jacobian of unloading power law in one pass (numba compiled); see unloadingPowerJac
+    """
+    jac = np.empty((len(h), 3))
+    for i, depthTotal in enumerate(h):
+      depth = max(depthTotal-hf, 0.0)
+      power = depth**m
+      jac[i, 0] = power
+      jac[i, 1] = -B*m*depth**(m-1) if depth>0 or m>=1 else 0.0   #infinite at h=hf for m<1: use 0
+      jac[i, 2] = B*power*math.log(depth) if depth>0 else 0.0
+    return jac
+else:
+  _oliverPharrIso, _unloadingPower, _unloadingPowerJac = None, None, None
+
+
 def YoungsModulus(self, modulusRed, nuThis=-1):
   """
   Calculate the Youngs modulus from the reduced Youngs modulus
@@ -20,7 +85,12 @@ def YoungsModulus(self, modulusRed, nuThis=-1):
   nu = self.nuMat
   if nuThis>0:
     nu = nuThis
-  modulus = (1.0-nu*nu) / ( 1.0/modulusRed - (1.0-self.model['nuTip']**2)/self.model['modulusTip'])
+  nuTip = self.model['nuTip']
+  if isinstance(modulusRed, np.ndarray) and modulusRed.dtype==np.float64:   #all steps in one buffer
+    modulus = np.divide(1.0, modulusRed)
+    modulus -= (1.0-nuTip*nuTip)/self.model['modulusTip']
+    return np.divide(1.0-nu*nu, modulus, out=modulus)
+  modulus = (1.0-nu*nu) / ( 1.0/modulusRed - (1.0-nuTip*nuTip)/self.model['modulusTip'])
   return modulus
 
 
@@ -38,11 +108,12 @@ def ReducedModulus(self, modulus, nuThis=-1):
   nu = self.nuMat
   if nuThis>0:
     nu = nuThis
-  modulusRed =  1.0/(  (1.0-nu*nu)/modulus + (1.0-self.model['nuTip']**2)/self.model['modulusTip'])
+  nuTip = self.model['nuTip']
+  modulusRed =  1.0/(  (1.0-nu*nu)/modulus + (1.0-nuTip*nuTip)/self.model['modulusTip'])
   return modulusRed
 
 
-def OliverPharrMethod(self, stiffness, pMax, h, nonMetal=1.):
+def OliverPharrMethod(self, stiffness, pMax, h, nonMetal=1., *, hardness=False):
   """
   Conventional Oliver-Pharr indentation method to calculate reduced Modulus modulusRed
 
@@ -58,15 +129,48 @@ def OliverPharrMethod(self, stiffness, pMax, h, nonMetal=1.):
       pMax (float): maximal force
       h (float): total penetration depth
       nonMetal (float): ability to change between metal=0 and nonMetal=1
+      hardness (bool): additionally return hardness pMax/Ac
 
   Returns:
-      list: modulusRed, Ac, hc
+      list: modulusRed, Ac, hc (, hardness)
   """
+  kind = self.tip.kind
+  if _oliverPharrIso is not None and kind in ('iso','isoPlusConstant') and isinstance(h, np.ndarray) and h.ndim==1:
+    coefficients, hOffset = self.tip.coefficients, 0.0
+    if kind=='isoPlusConstant':
+      coefficients, hOffset = coefficients[:-1], coefficients[-1]
+    stiffness, pMax = np.broadcast_to(stiffness, h.shape), np.broadcast_to(pMax, h.shape)
+    modulus, Ac, hc, hardnessAll = _oliverPharrIso(stiffness.astype(np.float64), pMax.astype(np.float64), \
+      h.astype(np.float64), coefficients, beta=nonMetal*self.model['beta'], hOffset=hOffset)
+    return [modulus, Ac, hc, hardnessAll] if hardness else [modulus, Ac, hc]
   threshAc = 1.e-12  #units in um: threshold = 1pm^2
   hc = h - nonMetal*self.model['beta']*pMax/stiffness
   Ac   = self.tip.areaFunction(hc)
-  Ac[Ac< threshAc] = threshAc  # prevent zero or negative area that might lock sqrt
-  modulus   = stiffness / (2.0*np.sqrt(Ac)/np.sqrt(np.pi))
+  np.maximum(Ac, threshAc, out=Ac)  # prevent zero or negative area that might lock sqrt
+  modulus   = stiffness * _HALF_SQRT_PI / np.sqrt(Ac)
+  if hardness:
+    return [modulus, Ac, hc, pMax/Ac]
+  return [modulus, Ac, hc]
+
+
+def OliverPharrMethodScalar(self, stiffness, pMax, h, nonMetal=1.):
+  """
+  Conventional Oliver-Pharr indentation method for a single data point |br|
+  same as OliverPharrMethod but with python floats, which avoids numpy overhead of 1-element arrays
+
+  Args:
+      stiffness (float): stiffness = slope dP/dh
+      pMax (float): maximal force
+      h (float): total penetration depth
+      nonMetal (float): ability to change between metal=0 and nonMetal=1
+
+  Returns:
+      list: modulusRed, Ac, hc
+  """
+  threshAc = 1.e-12  #units in um: threshold = 1pm^2
+  hc = h - nonMetal*self.model['beta']*pMax/stiffness
+  Ac = max(self.tip._areaFunctionScalar(hc), threshAc)  # pylint: disable=protected-access
+  modulus   = stiffness * _HALF_SQRT_PI / math.sqrt(Ac)
   return [modulus, Ac, hc]
 
 
@@ -78,19 +182,20 @@ def inverseOliverPharrMethod(self, stiffness, pMax, modulusRed, nonMetal=1.):
   - only used for verification of the Oliver-Pharr Method
 
   Args:
-      stiffness (float): slope dP/dh at the maximum load pMax
-      pMax (float): maximal force
-      modulusRed (float): modulusRed
+      stiffness (float, np.array): slope dP/dh at the maximum load pMax
+      pMax (float, np.array): maximal force
+      modulusRed (float, np.array): modulusRed
       nonMetal (float): ability to change between metal=0 and nonMetal=1
 
   Returns:
-      float: h penetration depth
+      float, np.array: h penetration depth
   """
-  Ac = math.pow( stiffness / (2.0*modulusRed/math.sqrt(math.pi))  ,2)
-  hc0 = math.sqrt(Ac / 24.494)           # first guess: perfect Berkovich
+  radius = stiffness / (2.0*modulusRed)   #contact radius sqrt(Ac/pi)
+  Ac = math.pi*radius*radius
+  hc0 = np.sqrt(Ac / 24.494)             # first guess: perfect Berkovich
   hc = self.tip.areaFunctionInverse(Ac, hc0=hc0)
   h = hc + nonMetal*self.model['beta']*pMax/stiffness
-  return h.flatten()
+  return h.flatten() if isinstance(h, np.ndarray) else h
 
 
 @staticmethod
@@ -103,10 +208,55 @@ def unloadingPowerFunc(h,B,hf,m):
   - m:  exponent       (no physical meaning)
   - hf: final depth = depth where force becomes 0
   """
+  if _unloadingPower is not None and isinstance(h, np.ndarray) and h.ndim==1 and h.dtype==np.float64:
+    return _unloadingPower(h, float(B), float(hf), float(m))
   value = B*np.power(h-hf,m)
   return value
 
 
+@staticmethod
+def unloadingPowerJac(h,B,hf,m):
+  """
+  internal function: analytical Jacobian of unloadingPowerFunc with respect to B, hf, m
+
+  - dp/dB  = (h-hf)^m
+  - dp/dhf = -B m (h-hf)^(m-1)
+  - dp/dm  = B (h-hf)^m ln(h-hf); limit 0 for h=hf
+  - dp/dhf is infinite at h=hf for m<1; 0 is used there to keep the Jacobian finite
+  """
+  if _unloadingPowerJac is not None and isinstance(h, np.ndarray) and h.ndim==1 and h.dtype==np.float64:
+    return _unloadingPowerJac(h, float(B), float(hf), float(m))
+  depth  = np.maximum(h-hf, 0.0)
+  power  = np.power(depth,m)
+  logDepth = np.log(np.where(depth>0, depth, 1.0))
+  depthM1  = np.power(depth,m-1) if m>=1 else np.power(np.where(depth>0, depth, np.inf),m-1)  #inf^(m-1)=0
+  return np.column_stack((power, -B*m*depthM1, B*power*logDepth))
+
+
+def _linearFit(x, y, cov=False):
+  """
+  least-squares line y = slope*x + intercept in closed form (replaces np.polyfit(x,y,1))
+
+  Args:
+    x (np.array): abscissa
+    y (np.array): ordinate
+    cov (bool): return also covariance matrix, scaled as np.polyfit(..., cov=True)
+
+  Returns:
+    np.array: slope, intercept [, covariance matrix]
+  """
+  xMean, yMean = x.mean(), y.mean()
+  dx = x-xMean
+  sxx = np.dot(dx,dx)
+  slope = np.dot(dx,y-yMean)/sxx                       #centered sums: stable for large x offsets
+  param = np.array([slope, yMean-slope*xMean])
+  if not cov:
+    return param
+  residual = y-(slope*x+param[1])
+  variance = np.dot(residual,residual)/(len(x)-2)/sxx
+  return param, variance*np.array([[1., -xMean], [-xMean, sxx/len(x)+xMean*xMean]])
+
+
 def stiffnessFromUnloading(self, p, h, plot=False):
   """
   Calculate single unloading stiffness from Unloading; see G200 manual, p7-6
@@ -137,39 +287,39 @@ def stiffnessFromUnloading(self, p, h, plot=False):
     loadStart, loadEnd, unloadStart, unloadEnd = cycle
     if loadStart>loadEnd or loadEnd>unloadStart or unloadStart>unloadEnd:
       print('*ERROR* stiffnessFromUnloading: indicies not in order:',cycle)
-    maskSegment = np.zeros_like(h, dtype=bool)
-    maskSegment[unloadStart:unloadEnd+1] = True
-    maskForce   = np.logical_and(p<p[loadEnd]*self.model['unloadPMax'], p>p[loadEnd]*self.model['unloadPMin'])
-    mask        = np.logical_and(maskSegment,maskForce)
-    if len(mask[mask])==0:
+    segment     = slice(unloadStart, unloadEnd+1)   #mask only within the unloading segment
+    pSegment    = p[segment]
+    maskSegment = (pSegment<p[loadEnd]*self.model['unloadPMax']) & (pSegment>p[loadEnd]*self.model['unloadPMin'])
+    hMask, pMask = h[segment][maskSegment], pSegment[maskSegment]   #masked copies used throughout the fit
+    if len(hMask)==0:
       print('*ERROR* mask of unloading is empty. Cannot fit\n')
       return None, None, None, None, None
     if plot:
       if cycleNum==0:
-        ax.plot(h[mask],p[mask],'-b', label='this cycle')
+        ax.plot(hMask,pMask,'-b', label='this cycle')
       else:
-        ax.plot(h[mask],p[mask],'-b')
+        ax.plot(hMask,pMask,'-b')
     #initial values of fitting
     # It would be great to be able to linearize the equation p=B(h-hf)^m. Linearization is possible for p=Bh^m with the log-rules
     #   log p=logB+m*logh   one could argue that h>hf and that this is a great approximation and use it to get initial B,m
     #   but that might not be so great and still cumbersome
     # Easier: try a few values of m, find the one that is best for the middle point and stick with that going into the fitting
     m0  = np.logspace(0.1, 1, 5) if self.model['unloadInitialM'] is None else self.model['unloadInitialM']
-    hf0 = (h[mask][0]/p[mask][0]**(1/m0) - h[mask][-1]/p[mask][-1]**(1/m0))/(1/p[mask][0]**(1/m0) -1/p[mask][-1]**(1/m0))
-    B0  = p[mask][0]/(h[mask][0]-hf0)**m0
+    hf0 = (hMask[0]/pMask[0]**(1/m0) - hMask[-1]/pMask[-1]**(1/m0))/(1/pMask[0]**(1/m0) -1/pMask[-1]**(1/m0))
+    B0  = pMask[0]/(hMask[0]-hf0)**m0
     if self.model['unloadInitialM'] is None:
-      pMid = B0*(h[mask][int(len(h[mask])/2)]-hf0)**m0
-      idxBest = np.abs(pMid-p[mask][int(len(h[mask])/2)]).argmin()
+      pMid = B0*(hMask[int(len(hMask)/2)]-hf0)**m0
+      idxBest = np.abs(pMid-pMask[int(len(hMask)/2)]).argmin()
       m0, hf0, B0 = m0[idxBest], hf0[idxBest], B0[idxBest]
     # elif self.model['unloadInitialValues']=='metal': # Assuming a more linear unloading curve
-    #   B0  = (p[mask][-1]-p[mask][0])/(h[mask][-1]-h[mask][0])
-    #   hf0 = h[mask][0] - p[mask][0]/B0
+    #   B0  = (pMask[-1]-pMask[0])/(hMask[-1]-hMask[0])
+    #   hf0 = hMask[0] - pMask[0]/B0
     #   m0  = 1.5 #to get of axis
     # elif self.model['unloadInitialValues']=='polymere': # Assuming more curvature in the unloading curve
-    #   hf0    = h[mask][-1]/2.0
+    #   hf0    = hMask[-1]/2.0
     #   m0     = 2
-    #   B0     = max(abs(p[mask][0] / np.power(h[mask][0]-hf0,m0)), 0.001)  #prevent neg. or zero
-    bounds = [[0,0,0.8],[np.inf, max(np.min(h[mask]),hf0), 10]]
+    #   B0     = max(abs(pMask[0] / np.power(hMask[0]-hf0,m0)), 0.001)  #prevent neg. or zero
+    bounds = [[0,0,0.8],[np.inf, max(np.min(hMask),hf0), 10]]
     B0  = min( max(B0,  bounds[0][0]), bounds[1][0])  #ensure parameters are in bounds
     hf0 = min( max(hf0, bounds[0][1]), bounds[1][1])  #ensure parameters are in bounds
     m0  = min( max(m0,  bounds[0][2]), bounds[1][2])  #ensure parameters are in bounds
@@ -177,9 +327,10 @@ def stiffnessFromUnloading(self, p, h, plot=False):
       print("Initial fitting values B,hf,m", B0,hf0,m0)
       print("  Bounds", bounds)
     try:
-      opt, _ = curve_fit(self.unloadingPowerFunc, h[mask],p[mask],      # pylint: disable=unbalanced-tuple-unpacking
-                         p0=[B0,hf0,m0], bounds=bounds, ftol=1e-4, maxfev=3000 )#set ftol to 1e-4 if accept more and fail less
-                         # sigma=np.arange(len(mask[mask]))+1, weights that decrease from beginning to end
+      opt, _ = curve_fit(self.unloadingPowerFunc, hMask,pMask,      # pylint: disable=unbalanced-tuple-unpacking
+                         p0=[B0,hf0,m0], bounds=bounds, ftol=1e-4, maxfev=3000, #set ftol to 1e-4 if accept more and fail less
+                         jac=self.unloadingPowerJac, check_finite=False)
+                         # sigma=np.arange(len(hMask))+1, weights that decrease from beginning to end
       if self.output['verbose']>2:
         print("  Optimal values B,hf,m", opt[0], opt[1], opt[2])
       B,hf,m = opt
@@ -191,22 +342,22 @@ def stiffnessFromUnloading(self, p, h, plot=False):
       print(traceback.format_exc())
       if self.output['verbose']>0:
         print("stiffnessFrommasking: #",cycleNum," Fitting failed. use linear")
-      B  = (p[mask][-1]-p[mask][0])/(h[mask][-1]-h[mask][0])
-      hf = h[mask][0] -p[mask][0]/B
+      B  = (pMask[-1]-pMask[0])/(hMask[-1]-hMask[0])
+      hf = hMask[0] -pMask[0]/B
       m  = 1.
       opt= (B,hf,m)
       powerlawFit.append(False)
     if self.model['evaluateSAtMax']:
-      stiffnessPlot = B*m*math.pow( h[unloadStart]-hf, m-1)
+      stiffnessPlot = B*m*(h[unloadStart]-hf)**(m-1.)
       stiffnessValue= p[unloadStart]-stiffnessPlot*h[unloadStart]
       validMask[unloadStart]=True
     else:
-      stiffnessPlot = B*m*math.pow( (h[mask][0]-hf), m-1)
-      stiffnessValue= p[mask][0]-stiffnessPlot*h[mask][0]
-      validMask[ np.where(mask)[0][0] ]=True
+      stiffnessPlot = B*m*(hMask[0]-hf)**(m-1.)
+      stiffnessValue= pMask[0]-stiffnessPlot*hMask[0]
+      validMask[ unloadStart+np.argmax(maskSegment) ]=True
     stiffness.append(stiffnessPlot)
     if plot:
-      x_ = np.linspace(0.5*h[mask].max(), h[mask].max(), 10)
+      x_ = np.linspace(0.5*hMask.max(), hMask.max(), 10)
       if cycleNum==0:
         ax.plot(x_,   self.unloadingPowerFunc(x_,B,hf,m),'m-', label='final fit')
         ax.plot(x_,   self.unloadingPowerFunc(x_,B0,hf0,m0),'g-', label='initial fit')
@@ -223,4 +374,7 @@ def stiffnessFromUnloading(self, p, h, plot=False):
     ax.set_ylabel(r'force [$\mathrm{mN}$]')
   if plot and not self.output['ax']:
     plt.show()
+  if opt is not None:                                  #full-length mask of the last cycle
+    mask = np.zeros_like(p, dtype=bool)
+    mask[segment] = maskSegment
   return stiffness, validMask, mask, opt, powerlawFit
@@ -1,8 +1,59 @@
 """Nanoindenter tip: shape / area-function and the compliance"""
 import math
+from functools import lru_cache
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.optimize import newton
+try:
+  from numba import njit
+except ImportError:
+  njit = None
+
+
+if njit is not None:
+  @njit(cache=True)
+  def _isoArea(h, prefactors):
+    """
+    ISO area function A=ax^2+bx^1+cx^0.5... in one pass over h (numba compiled)
+
+    Args:
+       h (numpy.array): contact depth in nm
+       prefactors (numpy.array): prefactors without type
+
+    Returns:
+       numpy.array: projected contact area [nm^2], negative values set to 0
+    """
+    area = np.empty_like(h)
+    for i, depth in enumerate(h):
+      power = depth*depth
+      value = prefactors[0]*power
+      for j in range(1, len(prefactors)):
+        power = math.sqrt(power)
+        value += prefactors[j]*power
+      area[i] = max(value, 0.0)
+    return area
+else:
+  _isoArea = None
+
+
+@lru_cache(maxsize=8)
+def _shapeGrid(maxDepth, steps):
+  """
+  Depth grid and reference radii used for plotting the indenter shape; read-only since cached
+
+  Args:
+     maxDepth (float): maximum depth [um]
+     steps (int): number of steps
+
+  Returns:
+     list: contact depth, radius of perfect Berkovich, radius of 60deg cone
+  """
+  hc = np.linspace(0, maxDepth, steps)
+  grid = [hc, 2.792254*hc, math.tan(math.radians(60.0))*hc]
+  for array in grid:
+    array.flags.writeable = False
+  return grid
+
 
 class Tip:
   """The main class to define indenter shape and other default values."""
@@ -70,6 +121,36 @@ class Tip:
     return
 
 
+  @property
+  def kind(self):
+    """
+    Type of area function: last entry of prefactors
+
+    Returns:
+       str: 'iso', 'isoPlusConstant', 'perfect', 'sphere'; None if interpolation function is used
+    """
+    return None if self.prefactors is None else self.prefactors[-1]
+
+
+  @property
+  def coefficients(self):
+    """
+    Numeric prefactors (without type) as contiguous float array: cached as long as prefactors do not change |br|
+    compare to a copy of the prefactors since the list is sometimes changed in-place (e.g. append type)
+
+    Returns:
+       numpy.array: prefactors without type, read-only
+    """
+    key = tuple(self.prefactors)
+    cache = self.__dict__.get('_coefficientsCache')
+    if cache is None or cache[0]!=key:
+      coefficients = np.array([i for i in key if not isinstance(i, str)], dtype=np.float64)
+      coefficients.flags.writeable = False
+      cache = (key, coefficients)
+      self._coefficientsCache = cache  # pylint: disable=attribute-defined-outside-init
+    return cache[1]
+
+
   def areaFunction(self, h):
     """
     AREA FUNCTION: from contact depth hc calculate area |br|
@@ -85,77 +166,163 @@ class Tip:
                does not account for cone at top
 
    Args:
-       h (numpy.array): contact depth in um
+       h (float, numpy.array): contact depth in um; any shape
 
     Returns:
        area: projected contact area [um^2]
     """
-    h = h* 1000.   #starting here: all is in nm
+    h = np.array(h, dtype=np.float64)   #new array, 0-d for scalars
+    h *= 1000.                          #starting here: all is in nm
     threshH = 1.e-3 #1pm
-    h[h< threshH] = threshH
+    np.maximum(h, threshH, out=h)
     area = np.zeros_like(h)
     if self.prefactors is None:
       self.interpFunction.bounds_error=False
       self.interpFunction.fill_value='extrapolate'
       return self.interpFunction(h/1000.)
-    if self.prefactors[-1]=='iso':
-      for i in range(0, len(self.prefactors)-1):
+    compiled = _isoArea is not None and h.ndim==1   #kernel compiled for 1-D float64; h is float64 already
+    if self.kind=='iso' and compiled:
+      area = _isoArea(h, self.coefficients)
+    elif self.kind=='iso':
+      for i, prefactor in enumerate(self.coefficients):
         exponent = 2./math.pow(2,i)
-        area += self.prefactors[i]*np.power(h,exponent)
+        area += prefactor*np.power(h,exponent)
         #print(i, self.prefactors[i], h,exponent, area)
-    elif self.prefactors[-1]=='isoPlusConstant':
+    elif self.kind=='isoPlusConstant' and compiled:
+      h += self.prefactors[-2]
+      area = _isoArea(h, self.coefficients[:-1])
+    elif self.kind=='isoPlusConstant':
       h += self.prefactors[-2]
       for i in range(0, len(self.prefactors)-2):
         exponent = 2./math.pow(2,i)
         area += self.prefactors[i]*np.power(h,exponent)
-    elif self.prefactors[-1]=='perfect':
-      area = 24.494*np.power(h,2)
-    elif self.prefactors[-1]=='sphere':
+    elif self.kind=='perfect':
+      area = 24.494*(h*h)
+    elif self.kind=='sphere':
+      rArea = self._radiusNm(h)
+      area = math.pi * rArea * rArea
+    else:
+      print("*ERROR*: prefactors last value does not contain type")
+    area = np.asarray(area)           #0-d array for scalars
+    np.maximum(area, 0.0, out=area)
+    area /= 1.e6  # conversion of unit from nm^2 to um^2
+    return area
+
+
+  def _radiusNm(self, h):
+    """
+    RADIUS FUNCTION: from contact depth hc calculate the contact radius |br|
+    sphere tips give the radius directly, all other tip shapes use sqrt(area/pi)
+
+    Args:
+       h (numpy.array): contact depth in nm
+
+    Returns:
+       numpy.array: contact radius [nm]
+    """
+    if self.kind!='sphere':
+      return np.sqrt(self.areaFunction(h/1000.)*1.e6/math.pi)
+    radius = self.prefactors[0]*1000.
+    openingAngle = self.prefactors[1]
+    cos      = math.cos(openingAngle/180.0*math.pi)
+    sin      = math.sin(openingAngle/180.0*math.pi)
+    tan      = math.tan(openingAngle/180.0*math.pi)
+    deltaX   = radius-h
+    rSphere  = np.sqrt(np.maximum(h*(2.*radius-h), 0.0))  #spherical section: R^2-(R-h)^2 = h(2R-h)
+    rCone    = radius/cos - tan*deltaX                    #tapered section
+    return np.where(deltaX > radius*sin, rSphere, rCone)
+
+
+  def _areaFunctionScalar(self, h):
+    """
+    AREA FUNCTION for a single contact depth: same as areaFunction but with python floats |br|
+    used in iterations (e.g. Newton) where numpy overhead of 1-element arrays dominates
+
+    Args:
+       h (float): contact depth in um
+
+    Returns:
+       float: projected contact area [um^2]
+    """
+    if self.prefactors is None:
+      self.interpFunction.bounds_error=False
+      self.interpFunction.fill_value='extrapolate'
+      return float(self.interpFunction(h))
+    h = max(h*1000., 1.e-3)  #starting here: all is in nm; threshold 1pm
+    area = 0.0
+    if self.kind=='iso':
+      for i in range(0, len(self.prefactors)-1):
+        area += self.prefactors[i]*math.pow(h, 2./math.pow(2,i))
+    elif self.kind=='isoPlusConstant':
+      h += self.prefactors[-2]
+      for i in range(0, len(self.prefactors)-2):
+        area += self.prefactors[i]*math.pow(h, 2./math.pow(2,i))
+    elif self.kind=='perfect':
+      area = 24.494*h*h
+    elif self.kind=='sphere':
       radius = self.prefactors[0]*1000.
-      openingAngle = self.prefactors[1]
-      cos      = math.cos(openingAngle/180.0*math.pi)
-      sin      = math.sin(openingAngle/180.0*math.pi)
-      tan      = math.tan(openingAngle/180.0*math.pi)
-      mask     = radius-h > radius*sin
-      rArea       = np.zeros_like(h)
-      rArea[mask] = np.sqrt(radius**2 - (radius-h[mask])**2 )  #spherical section
-      deltaY = radius / cos			 #tapered section
-      deltaX = radius-h[~mask]
-      rArea[~mask] = deltaY - tan*deltaX
+      openingAngle = self.prefactors[1]/180.0*math.pi
+      if radius-h > radius*math.sin(openingAngle):
+        rArea = math.sqrt(h*(2.*radius-h))  #spherical section: R^2-(R-h)^2 = h(2R-h)
+      else:
+        rArea = radius/math.cos(openingAngle) - math.tan(openingAngle)*(radius-h) #tapered section
       area = math.pi * rArea * rArea
     else:
       print("*ERROR*: prefactors last value does not contain type")
-    area[area<0] = 0.0
-    return area/1.e6 # conversion of unit from nm^2 to um^2
+    return max(area, 0.0)/1.e6 # conversion of unit from nm^2 to um^2
 
 
-  def areaFunctionInverse(self, area, hc0=70):
+  def areaFunctionInverse(self, area, hc0=None):
     """
     INVERSE AREA FUNCTION: from area calculate contact depth hc |br|
-    using Newton iteration with initial guess contact depth hc0
+    using Newton steps (analytical derivative) from initial guess contact depth hc0 until converged; if that
+    fails, scipy's newton is used. Arrays are inverted element by element.
 
     prefactors:
 
     -  "iso" type area function A=ax^2+bx^1+cx^0.5..., [nm]
+    -  "isoPlusConstant" type area function A=a(x+d)^2+b(x+d)^1+c(x+d)^0.5..., [nm]
     -  "perfect" type area function of a perfect Berkovich A=3*sqrt(3)*tan(65.27)^2 hc^2 = 24.494 hc^2
 
     Args:
-       area (numpy.array): projected contact area
-       hc0 (numpy.array): initial Guess contact depth
+       area (float, numpy.array): projected contact area
+       hc0 (float, numpy.array): initial Guess contact depth; None=invert leading term A=ax^2
 
     Returns:
-       numpy.array: h = total penetration depth
+       float, numpy.array: hc = contact depth; NaN if area function type cannot be inverted
     """
-    ## define function in form f(x)-y=0
-    def function(height):
-      return self.areaFunction(np.array([height]))-area
+    if self.kind not in ("iso", "isoPlusConstant", "perfect"):
+      print("*ERROR*: areaFunctionInverse not implemented for area function type", self.kind)
+      return np.full(np.shape(area), np.nan) if np.ndim(area)>0 else math.nan
+    if np.ndim(area)>0:
+      return np.vectorize(self.areaFunctionInverse, otypes=[float])(area, hc0)
+    if self.kind=="perfect":
+      return math.sqrt(area / 24.494)
+    coefficients, offset = self.coefficients, 0.0                    #offset [nm] added to depth
+    if self.kind=="isoPlusConstant":
+      coefficients, offset = coefficients[:-1], coefficients[-1]
+    ## analytical derivative dA/dh: sum a_i e_i h^(e_i-1) with e_i=2/2^i
+    def derivative(height):
+      height = max(height*1000., 1.e-3)+offset  #in nm
+      power  = height                     #h^(e_i-1) for e_0=2
+      value  = 0.0
+      for i, prefactor in enumerate(coefficients):
+        exponent = 2./math.pow(2,i)
+        value += prefactor*exponent*power
+        power = math.sqrt(power*height)/height   #h^(e_i/2-1) from h^(e_i-1)
+      return value/1000.                    #in um^2/um
     ## solve
-    if self.prefactors[-1]=="iso":
-      h = newton(function, hc0)
-    elif self.prefactors[-1]=="perfect":
-      h = math.sqrt(area / 24.494)
+    h = max(math.sqrt(area / coefficients[0])-offset/1000., 1.e-6) if hc0 is None else hc0
+    hStart = h
+    for _ in range(50):
+      step = (self._areaFunctionScalar(h)-area) / derivative(h)
+      h = h-step if step<h else h/2.   #never step to negative depth, halve depth instead
+      if abs(step) < 1.e-12*h:
+        break
     else:
-      print("*ERROR*: prefactors last value does not contain type")
+      #area function not monotonic at small depth for some calibrated tips: Newton might not converge
+      h = newton(lambda height: self._areaFunctionScalar(height)-area, hStart, fprime=derivative,
+                 tol=1.e-8, maxiter=50)
     return h
 
 
@@ -172,13 +339,12 @@ class Tip:
        fileName (str): if given, save to file
     """
     zoom = 0.5
-    hc = np.linspace(0, maxDepth, steps)
-    rNonPerfect = np.sqrt( self.areaFunction(hc)/math.pi)
-    rPerfect  = 2.792254*hc
+    hc, rPerfect, r60 = _shapeGrid(maxDepth, steps)
+    rNonPerfect = self._radiusNm(hc*1000.)/1000.
     if tipLabel is None:
       tipLabel = 'this tip'
     plt.plot(rPerfect,hc, '-k', label='Berkovich')
-    plt.plot(np.tan(np.radians(60.0))*hc,hc, '--k', label='$60^o$')
+    plt.plot(r60,hc, '--k', label='$60^o$')
     plt.plot(rNonPerfect, hc, 'C1-', label=tipLabel)
     plt.legend(loc="best")
     plt.ylabel(r'contact depth [$\mathrm{\mu m}$]')
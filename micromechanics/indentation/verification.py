@@ -3,74 +3,101 @@ import numpy as np
 import matplotlib.pyplot as plt
 from .definitions import Method
 
-def verifyOneData(self):
+#reference values from Agilent software [N/m, mN, nm, GPa, nm^2]
+_REFS = {
+  #  values from time=78.47sec of Cu_500muN_Creep_Vergleich
+  'agilentCu': {'prefactors':[32.9049, -6418.303798, 288484.8518, -989287.0625, 103588.5588, 675977.3345, "iso"],
+                'nuMat':0.35, 'harmStiff':159111.704268288, 'load':0.491297865144331,
+                'totalDepth':111.172457420282, 'H':0.82150309678705, 'E':190.257729329881,
+                'modulusRed':182.338858733495, 'S2overP':51529.9093101531, 'Ac':598047.490101769},
+  #  values from time=78.47sec of FS.xls in 5Materials
+  'agilentFS': {'prefactors':[24.8204,402.507,-3070.91,3699.87,"iso" ], 'compliance':1000.0/9.2358e6,
+                'nuMat':0.18, 'harmStiff':25731.8375827836, 'load':0.987624311132669,
+                'totalDepth':88.2388854303261, 'H':10.0514655820034, 'E':75.1620054287519,
+                'S2overP':670.424429535749}}
+
+#quantities compared by verifyReadCalc: attribute name, y-label, log-scale
+_QUANTITIES = [('hc',         r'contact depth $h_c$ [$\mu m$]',  True),
+               ('Ac',         r'contact area $A_c$ [$\mu m^2$]', True),
+               ('modulusRed', 'reduced modulus [GPa]',           False),
+               ('modulus',    'modulus E [GPa]',                 False),
+               ('hardness',   'hardness [GPa]',                  False)]
+
+
+def verifyOneData(self, refKey='agilentCu'):
   """
   Test one data set to ensure everything still working: OliverPharrMethod and area functions
   (normal and inverse)
+
+  Args:
+    refKey (str): reference data set: 'agilentCu', 'agilentFS'
+
+  Returns:
+    dict: relative error [%] of each evaluated quantity to the reference value
   """
-  self.tip.prefactors = [32.9049, -6418.303798, 288484.8518, -989287.0625, 103588.5588, 675977.3345, "iso"]
+  ref = _REFS[refKey]
+  self.tip.prefactors = list(ref['prefactors'])
+  if 'compliance' in ref:
+    self.tip.compliance = ref['compliance']
   print("Test CSM method, and area functions (normal and inverse)")
-  #values from time=78.47sec of Cu_500muN_Creep_Vergleich
-  harmStiff   = 159111.704268288/1000.   #  159111.704268288N/m
-  load        = 0.491297865144331        #  0.491297865144331mN
-  totalDepth  = 111.172457420282/1000.   #  111.901346020458nm
-  print("   Set Poisson's ratio 0.35")
-  self.nuMat = 0.35
+  harmStiff   = ref['harmStiff']/1000.    #N/m -> mN/um
+  load        = ref['load']
+  totalDepth  = ref['totalDepth']/1000.   #nm -> um
+  print(f"   Set Poisson's ratio {ref['nuMat']}")
+  self.nuMat = ref['nuMat']
   print("   From Agilent software")
-  print("      harmStiff   = 159111.704268288 N/m")
-  print("      load        = 0.49129786514433 mN")
-  print("      totalDepth  = 111.901346020458 nm")
-  print("      H           = 0.82150309678705 GPa")
-  print("      E           = 190.257729329881 GPa")
-  print("      modulusRed  = 182.338858733495 GPa")
-  print("      Stiffness Squared Over Load=51529.9093101531 GPa")
-  print("      ContactArea = 598047.490101769 nm^2")
-  [modulusRed, Ac, _]  = self.OliverPharrMethod(np.array([harmStiff]), np.array([load]), \
-    np.array([totalDepth]))
-  print("   Evaluated by this python method")
-  print("      reducedModulus [GPa] =",round(modulusRed[0],4),"  with error=", \
-    round((modulusRed[0]-182.338858733495)*100/182.338858733495,4),'%')
-  print("      ContactArea    [um2] =",round(Ac[0],4),"  with error=", \
-    round((Ac[0]-598047.490101769/1.e6)*100/598047.490101769/1.e6,4),'%')
+  #                         key,          label,                         unit
+  for key, label, unit in [('harmStiff',  'harmStiff',                   'N/m'),
+                           ('load',       'load',                        'mN'),
+                           ('totalDepth', 'totalDepth',                  'nm'),
+                           ('H',          'H',                           'GPa'),
+                           ('E',          'E',                           'GPa'),
+                           ('modulusRed', 'modulusRed',                  'GPa'),
+                           ('S2overP',    'Stiffness Squared Over Load', 'GPa'),
+                           ('Ac',         'ContactArea',                 'nm^2')]:
+    if key in ref:
+      print(f"      {label:<11} = {ref[key]} {unit}")
+  [modulusRed, Ac, _]  = self.OliverPharrMethodScalar(harmStiff, load, totalDepth)
   modulus = self.YoungsModulus(modulusRed)
-  print("      Youngs Modulus [GPa] =",round(modulus[0],4),"  with error=", \
-    round((modulus[0]-190.257729329881)*100/190.257729329881,4),'%')
-  totalDepth2 = self.inverseOliverPharrMethod(np.array([harmStiff]), np.array([load]), modulusRed)
-  print("      By using inverse methods: total depth h=",totalDepth2[0], "[um]  with error=", \
-    round((totalDepth2[0]-totalDepth)*100/totalDepth,4),'%')
+  totalDepth2 = self.inverseOliverPharrMethod(harmStiff, load, modulusRed)
+  print("   Evaluated by this python method")
+  #             label,                  unit,  calculated,  expected
+  results = [('reducedModulus',      'GPa', modulusRed,  ref.get('modulusRed')),
+             ('ContactArea',         'um2', Ac,          ref['Ac']/1.e6 if 'Ac' in ref else None),
+             ('Youngs Modulus',      'GPa', modulus,     ref['E']),
+             ('total depth (inverse)','um', totalDepth2, totalDepth)]
+  errors = {result[0]:_reportError(*result) for result in results if result[-1] is not None}
   print("End Test")
-  return
+  return errors
+
 
 def verifyOneData1(self):
   """
-  Test one data set to ensure everything still working: OliverPharrMethod and area functions (normal and inverse)
+  Test one data set to ensure everything still working: same as verifyOneData with second reference data set
+
+  Returns:
+    dict: relative error [%] of each evaluated quantity to the reference value
+  """
+  return self.verifyOneData('agilentFS')
+
+
+def _reportError(label, unit, calc, expected):
   """
-  self.tip.prefactors = [24.8204,402.507,-3070.91,3699.87,"iso" ]
-  self.tip.compliance = 1000.0/9.2358e6
-  print("Test CSM method, and area functions (normal and inverse)")
-  #values from time=78.47sec of FS.xls in 5Materials
-  harmStiff   = 25731.8375827836/1000.   #  25731.8375827836 N/m
-  load        = 0.987624311132669        #  0.987624311132669 mN
-  totalDepth  = 88.2388854303261/1000.   #  88.2388854303261 nm
-  print("   Set Poisson's ratio 0.18")
-  self.nuMat = 0.18
-  print("   From Agilent software")
-  print("      harmContactStiff = 25731.8375827836 N/m")
-  print("      load             = 0.987624311132669 mN")
-  print("      totalDepth       = 88.2388854303261 nm")
-  print("      H           = 10.0514655820034 GPa")
-  print("      E           = 75.1620054287519 GPa")
-  print("      Stiffness Squared Over Load=670.424429535749 GPa")
-  [modulusRed, _, _]  = self.OliverPharrMethod(np.array([harmStiff]), np.array([load]), \
-    np.array([totalDepth]))
-  modulus = self.YoungsModulus(modulusRed)
-  print("      Youngs Modulus [GPa] =",modulus[0],"  with error=", \
-    round((modulus[0]-75.1620054287519)*100/75.1620054287519,4),'%'  )
-  totalDepth2 = self.inverseOliverPharrMethod(np.array([harmStiff]), np.array([load]), modulusRed)
-  print("      By using inverse methods: total depth h=",totalDepth2[0], "[um]  with error=", \
-    round((totalDepth2[0]-totalDepth)*100/totalDepth,4), '%')
-  print("End Test")
-  return
+  Print one calculated value of the verification and its relative error to the expected value
+
+  Args:
+    label (str): name of quantity
+    unit (str): unit of quantity
+    calc (float): value calculated by these functions
+    expected (float): expected value, e.g. from Agilent software
+
+  Returns:
+    float: relative error [%]
+  """
+  error = (calc-expected)*100./expected
+  print(f"      {label+' ['+unit+']':<26} = {calc:.6g}  with error= {error:.4f} %")
+  return error
+
 
 def verifyReadCalc(self, plot=True):
   """
@@ -78,85 +105,99 @@ def verifyReadCalc(self, plot=True):
 
   Args:
     plot (bool): plot comparison
+
+  Returns:
+    dict: error of each quantity of _QUANTITIES: norm of calc-read for CSM, relative error [%] otherwise
   """
-  modulusRed,Ac,hc = self.OliverPharrMethod(self.slope, self.p[self.valid], self.h[self.valid])
-  modulus = self.YoungsModulus(modulusRed)
-  hardness = self.p[self.valid] / Ac
-  if self.method==Method.CSM:
-    if plot:
-      plt.semilogy(self.t[self.valid],self.hc,'o',label='read')
-      plt.semilogy(self.t[self.valid],hc,label='calc')
-      plt.legend(loc=0)
-      plt.xlim(left=0)
-      plt.ylim([0,np.max(self.hc)])
-      plt.xlabel('time [s]')
-      plt.ylabel('contact depth $h_c$ [$\mu m$]') # pylint: disable=anomalous-backslash-in-string
-      plt.title(f"Error in hc: {np.linalg.norm(hc-self.hc):.2e}" )
-      plt.show()
-    else:
-      print(f"  Error in hc: {np.linalg.norm(hc-self.hc):.2e}")
-  else:
-    print(f"Error in hc: {abs(hc-self.hc)*100./hc:.3e} %% between {hc:.3e} and {self.hc:.3e}")
-  if self.method==Method.CSM:
-    if plot:
-      plt.semilogy(self.t[self.valid],self.Ac,'o',label='read')
-      plt.semilogy(self.t[self.valid],Ac,label='calc')
-      plt.legend(loc=0)
-      plt.xlim(left=0)
-      plt.ylim([0,np.max(self.Ac)])
-      plt.xlabel('time [s]')
-      plt.ylabel('contact area $A_c$ [$\mu m^2$]') # pylint: disable=anomalous-backslash-in-string
-      plt.title(f"Error in Ac: {np.linalg.norm(Ac-self.Ac):.2e}")
-      plt.show()
+  modulusRed,Ac,hc,hardness = self.OliverPharrMethod(self.slope, self.pValid, self.hValid, hardness=True)
+  calculated = {'hc':hc, 'Ac':Ac, 'modulusRed':modulusRed, 'modulus':self.YoungsModulus(modulusRed),
+                'hardness':hardness}
+  tValid = self.t[self.valid] if self.method==Method.CSM else None   #only needed for CSM plots
+  formatter = {'float_kind':'{:.3e}'.format}
+  axes = [None]*len(_QUANTITIES)
+  difference = np.empty_like(Ac) if self.method==Method.CSM else None  #buffer reused for all error norms
+  if self.method==Method.CSM and plot:
+    fig, axes = plt.subplots(2, 3, figsize=(15,8))
+    fig.delaxes(axes.flat[-1])
+    axes = axes.flat
+  errors = {}
+  for quantity, ax in zip(_QUANTITIES, axes):
+    name = quantity[0]
+    read, calc = getattr(self, name), calculated[name]
+    if self.method==Method.CSM:
+      errors[name] = _plotOrError(tValid, read, calc, quantity, ax=ax, difference=difference)
+    elif np.size(calc)==1:   #single unloading: plain python floats
+      calc, read = float(np.ravel(calc)[0]), float(np.ravel(read)[0])
+      errors[name] = abs(calc-read)*100./calc
+      print(f"Error in {name}: {errors[name]:.3e} % between {calc:.3e} and {read:.3e}")
     else:
-      print(f"  Error in Ac: {np.linalg.norm(Ac-self.Ac):.2e}")
-  else:
-    print(f"Error in Ac: {abs(Ac-self.Ac)*100./Ac:.3e} %% between {Ac:.3e} and {self.Ac:.3e}")
-  if self.method==Method.CSM:
-    if plot:
-      plt.plot(self.t[self.valid],self.modulusRed,'o',label='read')
-      plt.plot(self.t[self.valid],modulusRed,label='calc')
-      plt.legend(loc=0)
-      plt.xlabel('time [s]')
-      plt.ylabel('reduced modulus [GPa]')
-      plt.xlim(left=0)
-      plt.ylim([0,np.max(self.modulusRed)])
-      plt.title(f"Error in modulusRed: {np.linalg.norm(modulusRed-self.modulusRed):.2e}")
-      plt.show()
-    else:
-      print(f"  Error in modulusRed: {np.linalg.norm(modulusRed-self.modulusRed):.2e}")
-  else:
-    print(f"Error in modulusRed: {abs(modulusRed-self.modulusRed)*100./modulusRed:.3e} %% between "+
-          f"{modulusRed:.3e} and {self.modulusRed:.3e}")
-  if self.method==Method.CSM:
-    if plot:
-      plt.plot(self.t[self.valid],self.modulus,'o',label='read')
-      plt.plot(self.t[self.valid],modulus,label='calc')
-      plt.legend(loc=0)
-      plt.xlabel('time [s]')
-      plt.ylabel('modulus E [GPa]')
-      plt.xlim(left=0)
-      plt.ylim([0,np.max(self.modulus)])
-      plt.title(f"Error in modulus: {np.linalg.norm(modulus-self.modulus):.2e}")
-      plt.show()
-    else:
-      print(f"  Error in modulus: {np.linalg.norm(modulus-self.modulus):.2e}")
-  else:
-    print(f"Error in modulus: {abs(modulus-self.modulus)*100./modulus:.3e}%% {modulus:.3e}-{self.modulus:.3e}")
-  if self.method==Method.CSM:
-    if plot:
-      plt.plot(self.t[self.valid],self.hardness,'o',label='read')
-      plt.plot(self.t[self.valid],hardness,label='calc')
-      plt.legend(loc=0)
-      plt.xlabel('time [s]')
-      plt.ylabel('hardness [GPa]')
-      plt.xlim(left=0)
-      plt.ylim([0,np.max(self.hardness)])
-      plt.title(f"Error in hardness: {np.linalg.norm(hardness-self.hardness):.2e}")
-      plt.show()
-    else:
-      print(f"  Error in hardness: {np.linalg.norm((hardness-self.hardness)):.2e}")
-  else:
-    print(f"Error in hardness:  {abs(hardness-self.hardness)*100./hardness:.3e} %% between {hardness:.3e} "+
-          f"and {self.hardness:.3e}")
-  return
+      errors[name] = np.abs(calc-read)*100./calc
+      print(f"Error in {name}: {np.array2string(errors[name], formatter=formatter)} % between "+
+            f"{np.array2string(calc, formatter=formatter)} and {np.array2string(read, formatter=formatter)}")
+  if self.method==Method.CSM and plot:
+    fig.tight_layout()
+    plt.show()
+  return errors
+
+
+def verifyReadCalcAll(self):
+  """
+  Compare data saved in the file to data calculated by these functions for all tests of a CSM file |br|
+  OliverPharrMethod is evaluated once on the data of all tests stacked together; errors are printed per test
+
+  Returns:
+    dict: for each test name, the norm of calc-read of each quantity of _QUANTITIES; empty if not CSM
+  """
+  if self.method!=Method.CSM:
+    print("**ERROR verifyReadCalcAll: only implemented for CSM; use verifyReadCalc for each test")
+    return {}
+  names, slope, p, h, read = [], [], [], [], []
+  for testName in self:
+    names.append(testName)
+    slope.append(self.slope)
+    p.append(self.pValid)
+    h.append(self.hValid)
+    read.append(np.vstack([getattr(self, name) for name, _, _ in _QUANTITIES]))
+  modulusRed,Ac,hc,hardness = self.OliverPharrMethod(np.concatenate(slope), np.concatenate(p), np.concatenate(h),\
+    hardness=True)
+  calc = np.vstack([hc, Ac, modulusRed, self.YoungsModulus(modulusRed), hardness])
+  splits = np.cumsum([len(i) for i in h])[:-1]
+  errorsAll = {}
+  for testName, calcTest, readTest in zip(names, np.split(calc, splits, axis=1), read):
+    errors = np.linalg.norm(calcTest-readTest, axis=1)
+    print(f"{testName}: errors in {', '.join(name for name, _, _ in _QUANTITIES)}: "+
+          ", ".join(f"{i:.2e}" for i in errors))
+    errorsAll[testName] = dict(zip((name for name, _, _ in _QUANTITIES), errors))
+  return errorsAll
+
+
+def _plotOrError(time, read, calc, quantity, *, ax=None, difference=None):
+  """
+  Compare one quantity of a CSM measurement read from file to the calculated one: plot or print error
+
+  Args:
+    time (numpy.array): time of valid data points
+    read (numpy.array): values read from file
+    calc (numpy.array): values calculated by these functions
+    quantity (tuple): entry of _QUANTITIES: name, y-label of plot, use logarithmic y-axis
+    ax (matplotlib.axes): axis to plot comparison into; None=print error
+    difference (numpy.array): buffer of same shape for calc-read; None=allocate new array
+
+  Returns:
+    float: norm of calc-read
+  """
+  name, ylabel, logScale = quantity
+  error = np.linalg.norm(np.subtract(calc, read, out=difference))
+  if ax is None:
+    print(f"  Error in {name}: {error:.2e}")
+    return error
+  plotFunction = ax.semilogy if logScale else ax.plot
+  plotFunction(time, read, 'o', label='read')
+  plotFunction(time, calc, label='calc')
+  ax.legend(loc=0)
+  ax.set_xlim(left=0)
+  ax.set_ylim([0,read.max()])
+  ax.set_xlabel('time [s]')
+  ax.set_ylabel(ylabel)
+  ax.set_title(f"Error in {name}: {error:.2e}")
+  return error
@@ -36,6 +36,29 @@ class TestStringMethods(unittest.TestCase):
 			self.assertTrue(False,'Exception occurred')
 		return
 
+	def test_k2p(self):
+		try:
+			### MAIN ###
+			i = Indentation('examples/Agilent/CSM.xls')
+			i.analyse()
+			i.plotAsDepth('K2P')
+			k2pFirst = np.array(i.k2p)
+			i.nextTest()
+			i.plotAsDepth('K2P')
+			self.assertEqual(len(i.k2p), len(i.hValid), 'K2P not recomputed for next test')
+			self.assertTrue(np.allclose(i.k2p, i.slope*i.slope/i.pValid), 'K2P not recomputed for next test')
+			self.assertFalse(len(i.k2p)==len(k2pFirst) and np.allclose(i.k2p, k2pFirst), 'K2P of previous test used')
+			i.k2p[:] = 0.                     #stale values of same length: only the test epoch forces recomputation
+			i.nextTest(newTest=False)
+			i.plotAsDepth('K2P')
+			self.assertTrue(np.allclose(i.k2p, i.slope*i.slope/i.pValid), 'K2P not recomputed after redoing test')
+			### END OF MAIN ###
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
 	def tearDown(self):
 		return
 
@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+"""Compare fast numerical helpers to the straightforward code they replace"""
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+import numpy as np
+from scipy import ndimage
+import lmfit
+from micromechanics.indentation import main, theory, tip
+from micromechanics.indentation.hertz import _secondRate
+from micromechanics.indentation.calibration import _fitIsoArea
+
+class TestStringMethods(unittest.TestCase):
+	def test_secondRate(self):
+		def reference(depthRate, iJump):
+			listDepthRate = depthRate.tolist()
+			iJump2 = np.argmax(listDepthRate)
+			while (iJump2-iJump)<3:
+				del listDepthRate[iJump2]
+				iJump2 = np.argmax(listDepthRate)
+			return np.max(listDepthRate)
+		self.assertEqual(_secondRate(np.array([0,10,0,0,5,0,0,0,3.]), 1), 3.0)
+		rng = np.random.default_rng(0)
+		for _ in range(2000):
+			size = rng.integers(8,60)
+			depthRate = rng.integers(0,6,size).astype(float) if rng.random()<0.5 else rng.random(size)
+			iJump = int(np.argmax(depthRate))
+			try:
+				expected = reference(depthRate, iJump)
+			except ValueError:                          #all rates deleted
+				self.assertRaises(ValueError, _secondRate, depthRate, iJump)
+				continue
+			self.assertEqual(_secondRate(depthRate, iJump), expected, str(depthRate))
+		return
+
+	def test_closeOpenMask(self):
+		def reference(mask, size):
+			maskTry = ndimage.binary_closing(mask, structure=np.ones((size,)))
+			return ndimage.binary_opening(maskTry, structure=np.ones((size,)))
+		rng = np.random.default_rng(1)
+		masks = [np.ones(12, dtype=bool), np.zeros(12, dtype=bool), np.array([1,1,0,0,0,1,1,1,1,0,1,1],dtype=bool), \
+			np.array([0,1,1,1,0,1,1,1,1,0,0],dtype=bool), np.array([1],dtype=bool)]     #runs at both edges
+		for _ in range(2000):
+			size = rng.integers(1,100)
+			masks.append(rng.random(size) < rng.random())
+		implementations = [main._closeOpenMaskScan] if main._closeOpenMaskScan is not None else []
+		with mock.patch.object(main, '_closeOpenMaskScan', None):                   #numpy path
+			for mask in masks:
+				for size in (1,2,3,4,7):
+					self.assertTrue(np.array_equal(main._closeOpenMask(mask, size), reference(mask, size)), str((mask,size)))
+		for closeOpen in implementations:                                            #numba path
+			for mask in masks:
+				for size in (1,2,3,4,7):
+					self.assertTrue(np.array_equal(closeOpen(mask, size), reference(mask, size)), str((mask,size)))
+		return
+
+	def test_histogram(self):
+		rng = np.random.default_rng(2)
+		samples = [np.array([0.,1.,2.,3.]), np.array([0.1,0.2,0.3]), np.full(5,0.3), np.linspace(0.,1.,1001)]  #values on edges
+		for _ in range(1000):
+			values = rng.random(rng.integers(1,300))*10.**rng.uniform(-5,5) + rng.uniform(-100,100)
+			samples.append(np.round(values,2) if rng.random()<0.5 else values)
+		for values in samples:
+			for numBins in (1,7,1000):
+				counts, binEdges = main._histogram(values, values.min(), values.max(), numBins)
+				countsRef, binEdgesRef = np.histogram(values, bins=numBins)
+				self.assertTrue(np.array_equal(binEdges, binEdgesRef), str(values))
+				self.assertTrue(np.array_equal(counts, countsRef), str(values))
+				self.assertEqual(counts[-1], np.count_nonzero(values>=binEdgesRef[-2]))      #right edge in last bin
+		return
+
+	def test_linearFit(self):
+		rng = np.random.default_rng(3)
+		for offset in (0., 1.e3):
+			x = rng.random(50)+offset
+			y = 2.5*x - 7. + rng.normal(0., 0.1, 50)
+			param, covariance = theory._linearFit(x, y, cov=True)
+			paramRef, covarianceRef = np.polyfit(x, y, 1, cov=True)
+			self.assertTrue(np.allclose(param, paramRef, rtol=1.e-6, atol=0.), str(offset))
+			self.assertTrue(np.allclose(theory._linearFit(x, y), paramRef, rtol=1.e-6, atol=0.), str(offset))
+			self.assertTrue(np.allclose(covariance, covarianceRef, rtol=1.e-5, atol=0.), str(offset))
+		return
+
+	def test_fitIsoArea(self):
+		def reference(hc, Ac, numPolynomial):                                        #previous lmfit code
+			def fitFunct(params):
+				areaTip.prefactors = [params[x].value for x in params]+['iso']
+				return np.abs(Ac-areaTip.areaFunction(hc))/len(Ac)
+			params = lmfit.Parameters()
+			params.add('m0', value= 24.3, min=10.0, max=60.0)
+			for idx in range(1,numPolynomial):
+				startVal = np.power(100,idx)
+				params.add('m'+str(idx), value= startVal/1000, min=-startVal*100, max=startVal*100)
+			result = lmfit.minimize(fitFunct, params, max_nfev=10000)
+			return [result.params[x].value for x in result.params], [result.params[x].stderr for x in result.params]
+		areaTip = tip.Tip()
+		rng = np.random.default_rng(4)
+		hc = np.linspace(0.02, 1.5, 200)
+		for prefactorsTrue in ([24.5, 400., 2000.], [26., -150., 1500.], [24.5, 200.]):
+			areaTip.prefactors = prefactorsTrue+['iso']
+			Ac = areaTip.areaFunction(hc)*(1.+rng.normal(0., 0.001, len(hc)))
+			prefactors, stderr = _fitIsoArea(hc, Ac, len(prefactorsTrue))
+			prefactorsRef, stderrRef = reference(hc, Ac, len(prefactorsTrue))
+			self.assertTrue(np.allclose(prefactors, prefactorsRef, rtol=1.e-5, atol=0.), str((prefactors, prefactorsRef)))
+			self.assertTrue(np.allclose(stderr, stderrRef, rtol=1.e-4, atol=0.), str((stderr, stderrRef)))
+			areaTip.prefactors = prefactors+['iso']
+			residual = Ac-areaTip.areaFunction(hc)
+			areaTip.prefactors = prefactorsRef+['iso']
+			residualRef = Ac-areaTip.areaFunction(hc)
+			self.assertLessEqual(np.dot(residual,residual), np.dot(residualRef,residualRef)*(1.+1.e-12))
+		return
+
+	def test_areaFunctionInverse(self):
+		areaTip = tip.Tip()
+		hc = np.geomspace(0.005, 2., 50)
+		for shape in ([24.5, 400., 2000., 'iso'], [24.5, 400., 2000., 30., 'isoPlusConstant'], ['perfect']):
+			areaTip.prefactors = shape
+			Ac = areaTip.areaFunction(hc)
+			self.assertTrue(np.allclose(areaTip.areaFunctionInverse(Ac), hc, rtol=1.e-9, atol=0.), str(shape))
+			self.assertTrue(np.allclose(areaTip.areaFunctionInverse(Ac, hc0=hc*1.2), hc, rtol=1.e-9, atol=0.), str(shape))
+			self.assertAlmostEqual(areaTip.areaFunctionInverse(float(Ac[20])), hc[20], delta=1.e-9*hc[20])
+			sample = SimpleNamespace(tip=areaTip, model={'beta':0.75})
+			modulusRed, pMax = 150., 2.+hc*50.
+			stiffness = 2.*modulusRed*np.sqrt(Ac/np.pi)
+			h = theory.inverseOliverPharrMethod(sample, stiffness, pMax, modulusRed)
+			self.assertTrue(np.allclose(h, hc+0.75*pMax/stiffness, rtol=1.e-9, atol=0.), str(shape))
+		return
+
+	@unittest.skipIf(theory._oliverPharrIso is None, 'numba not installed')
+	def test_numbaKernels(self):
+		rng = np.random.default_rng(5)
+		h = np.sort(rng.random(500))*1.5
+		stiffness = 100.+h*1.e3
+		stiffness[:5], stiffness[7] = 0., np.nan                                      #CSM slopes can be 0 or NaN
+		for shape in ([24.5, 400., 2000., 'iso'], [24.5, 400., 2000., 30., 'isoPlusConstant']):
+			sample = SimpleNamespace(tip=tip.Tip(), model={'beta':0.75})
+			sample.tip.prefactors = shape
+			for depth, slope in ((h, stiffness), (h.reshape(20,25), stiffness.reshape(20,25)), \
+			                     (np.array(h[100]), np.array(stiffness[100])), (h[100], stiffness[100])):  #1-D, 2-D, 0-d, scalar
+				areaNumba = sample.tip.areaFunction(depth)
+				resultNumba = theory.OliverPharrMethod(sample, slope, 50.+depth*20., depth, hardness=True)
+				with mock.patch.object(tip, '_isoArea', None), mock.patch.object(theory, '_oliverPharrIso', None):
+					self.assertTrue(np.allclose(areaNumba, sample.tip.areaFunction(depth), rtol=1.e-12, atol=0.), str(shape))
+					resultNumpy = theory.OliverPharrMethod(sample, slope, 50.+depth*20., depth, hardness=True)
+				for valueNumba, valueNumpy in zip(resultNumba, resultNumpy):
+					self.assertEqual(np.shape(valueNumba), np.shape(valueNumpy), str(shape))
+					self.assertTrue(np.allclose(valueNumba, valueNumpy, rtol=1.e-12, atol=0., equal_nan=True), str(shape))
+		for param in ((10., 0.3, 1.5), (10., 0.3, 0.8)):
+			powerNumba = theory.unloadingPowerFunc(h, *param)
+			jacobianNumba = theory.unloadingPowerJac(h, *param)
+			with mock.patch.object(theory, '_unloadingPower', None), mock.patch.object(theory, '_unloadingPowerJac', None):
+				self.assertTrue(np.allclose(powerNumba[h>0.3], theory.unloadingPowerFunc(h, *param)[h>0.3], rtol=1.e-12), str(param))
+				self.assertTrue(np.allclose(jacobianNumba, theory.unloadingPowerJac(h, *param), rtol=1.e-12), str(param))
+		return
+
+	def tearDown(self):
+		return
+
+if __name__ == '__main__':
+	unittest.main()
@@ -1,5 +1,6 @@
 import traceback
 import unittest
+import numpy as np
 from micromechanics.indentation import Indentation, Tip
 
 class TestStringMethods(unittest.TestCase):
@@ -7,7 +8,9 @@ class TestStringMethods(unittest.TestCase):
 		try:
 			# MAIN
 			i = Indentation('')
-			i.verifyOneData()
+			errors = i.verifyOneData()
+			self.assertEqual(len(errors), 4, 'Quantities missing: '+str(errors))
+			self.assertTrue(all(abs(j)<0.02 for j in errors.values()), 'Errors [%] increased: '+str(errors))
 			# END OF MAIN
 			print('\n*** DONE WITH VERIFY ***')
 		except:
@@ -20,7 +23,9 @@ class TestStringMethods(unittest.TestCase):
 		try:
 			# MAIN
 			i = Indentation('')
-			i.verifyOneData1()
+			errors = i.verifyOneData1()
+			self.assertEqual(len(errors), 2, 'Quantities missing: '+str(errors))
+			self.assertTrue(all(abs(j)<0.01 for j in errors.values()), 'Errors [%] increased: '+str(errors))
 			# END OF MAIN
 			print('\n*** DONE WITH VERIFY ***')
 		except:
@@ -49,6 +54,28 @@ class TestStringMethods(unittest.TestCase):
 		return
 
 
+	def test_verify4(self):
+		try:
+			# MAIN
+			tip = Tip(shape = [2.4695e+001,3.9577e+002,-1.6132e+001,1.3341e+002,1.0646e+002,'iso'])
+			i = Indentation('examples/Agilent/FS_XP.xls', nuMat=0.18, tip=tip, model={'cropSlopeToLoading': False})
+			errorsAll = i.verifyReadCalcAll()
+			#stacked evaluation has to give the same errors as evaluating each test separately
+			for testName in i:
+				errors, errorsStacked = i.verifyReadCalc(plot=False), errorsAll.pop(testName)
+				self.assertEqual(errors.keys(), errorsStacked.keys(), 'Quantities of '+testName+' differ')
+				for name, error in errors.items():
+					self.assertTrue(np.isclose(error, errorsStacked[name], rtol=1.e-6, atol=1.e-12),
+									'Error in '+name+' of '+testName+' differs: '+str(error)+' '+str(errorsStacked[name]))
+			self.assertEqual(len(errorsAll), 0, 'Tests missing in verifyReadCalc: '+str(errorsAll))
+			# END OF MAIN
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+
 	def tearDown(self):
 		return
 